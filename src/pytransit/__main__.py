@@ -16,6 +16,9 @@ except Exception as e:
 
 import pytransit
 import pytransit.transit_tools as transit_tools
+import pytransit.tnseq_tools as tnseq_tools
+import pytransit.norm_tools as norm_tools
+import pytransit.stat_tools as stat_tools
 import pytransit.analysis
 
 method_wrap_width = 250
@@ -28,6 +31,49 @@ all_methods.update(export_methods)
 wildcard = "Python source (*.py)|*.py|" \
             "All files (*.*)|*.*"
 transit_prefix = "[TRANSIT]"
+usage_options = "[--workers <N>] [--compact] [--stream] [--cache-genes] [--no-cache] [--fdr <BH|Storey|Bonferroni>] [--norm-factors <file>] [--save-norm-factors <file>]"
+
+
+def pop_option(flag, convert=str):
+    """Removes the flag and its value from sys.argv, returning the converted value.
+
+    Arguments:
+        flag (str): Name of the flag, e.g. "--workers".
+        convert (function): Function converting the value, raising ValueError
+            if it is invalid.
+
+    Returns:
+        Converted value, or None if the flag is not given.
+
+    Raises:
+        ValueError: If the value is missing or invalid.
+    """
+    if flag not in sys.argv:
+        return None
+    i = sys.argv.index(flag)
+    if i+1 >= len(sys.argv):
+        raise ValueError("The %s flag requires a value." % flag)
+    try:
+        value = convert(sys.argv[i+1])
+    except ValueError:
+        raise ValueError("Invalid value '%s' for the %s flag." % (sys.argv[i+1], flag))
+    del sys.argv[i:i+2]
+    return value
+
+
+def positive_int(text):
+    """Converts the text to a positive integer, raising ValueError otherwise."""
+    value = int(text)
+    if value < 1:
+        raise ValueError(text)
+    return value
+
+
+def fdr_method(text):
+    """Checks that the text names a multiple testing correction, raising ValueError otherwise."""
+    if text not in ("BH", "Storey", "Bonferroni"):
+        raise ValueError(text)
+    return text
 
 
 def main(args=None):
@@ -36,6 +82,50 @@ def main(args=None):
     if DEBUG:
         sys.argv.remove("--debug")
 
+    try:
+        # Number of worker processes used to load datasets in parallel
+        workers = pop_option("--workers", positive_int)
+        # Read normalization factors from (or save them to) a factors file
+        factors_file = pop_option("--norm-factors")
+        save_factors_file = pop_option("--save-norm-factors")
+        # Multiple testing correction of the adjusted p-values (BH, Storey or Bonferroni)
+        fdr = pop_option("--fdr", fdr_method)
+    except ValueError as e:
+        print "Error: %s" % e
+        print "Usage: python %s <method> %s" % (sys.argv[0], usage_options)
+        return
+
+    if workers is not None:
+        tnseq_tools.default_workers = workers
+    if factors_file is not None:
+        norm_tools.factors_file = factors_file
+    if save_factors_file is not None:
+        norm_tools.save_factors_file = save_factors_file
+    if fdr is not None:
+        stat_tools.default_fdr_method = fdr
+
+    # Hold read-counts as uint32/float32 instead of float64
+    if "--compact" in sys.argv:
+        sys.argv.remove("--compact")
+        tnseq_tools.default_compact = True
+
+    # Read the datasets in blocks of sites in griffin and resampling
+    if "--stream" in sys.argv:
+        sys.argv.remove("--stream")
+        tnseq_tools.default_stream = True
+
+    # Reuse the genes constructed from the same datasets and parameters
+    if "--cache-genes" in sys.argv:
+        sys.argv.remove("--cache-genes")
+        tnseq_tools.use_genes_cache = True
+
+    # Do not read or write any cached wig files, normalizations or genes
+    if "--no-cache" in sys.argv:
+        sys.argv.remove("--no-cache")
+        tnseq_tools.use_cache = False
+        tnseq_tools.use_genes_cache = False
+        norm_tools.use_cache = False
+
     # Check if running in GUI Mode
     if len(sys.argv) == 1 and hasWx:
 
@@ -56,7 +146,7 @@ def main(args=None):
         print "Please install wxPython to run in GUI Mode."
         print "To run in Console Mode please follow these instructions:"
         print ""
-        print "Usage: python %s <method>" % sys.argv[0]
+        print "Usage: python %s <method> %s" % (sys.argv[0], usage_options)
         print "List of known methods:"
         for m in methods:
             print "\t - %s" % m
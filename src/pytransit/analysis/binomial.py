@@ -326,8 +326,9 @@ class BinomialMethod(base.SingleConditionMethod):
 
         #
         self.transit_message("Setting Initial Values")
-        K = numpy.array([sum([1 for x in gene.reads.flatten() if x> 0]) for gene in G])
-        N = numpy.array([len(gene.reads.flatten()) for gene in G])
+        table = G.table()
+        K = table.k_reps
+        N = table.n * G.data.shape[0]
 
         for g,gene in enumerate(G):
             if N[g] == 0: theta[g][0] = 0.5
@@ -22,6 +22,7 @@ import random
 import numpy
 import scipy.stats
 import datetime
+import collections
 
 import base
 import pytransit.transit_tools as transit_tools
@@ -31,6 +32,9 @@ import pytransit.stat_tools as stat_tools
 
 #method_name = "griffin"
 
+# Statistics of a gene needed for the output (results are sorted by orf).
+GeneStats = collections.namedtuple("GeneStats", ["orf", "name", "desc", "k", "n", "r", "s", "t"])
+
 
 ############# GUI ELEMENTS ##################
 
@@ -219,21 +223,29 @@ class GriffinMethod(base.SingleConditionMethod):
 
         #Get orf data
         self.transit_message("Getting Data")
-        G = tnseq_tools.Genes(self.ctrldata, self.annotation_path, minread=self.minread, reps=self.replicates, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus)
+        if tnseq_tools.default_stream:
+            # Read the datasets in blocks, keeping only the statistics of each gene.
+            genes = tnseq_tools.iter_genes(self.ctrldata, self.annotation_path, minread=self.minread, reps=self.replicates, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus)
+            stats = [GeneStats(gene.orf, gene.name, gene.desc, gene.k, gene.n, gene.r, gene.s, gene.t) for gene in genes]
+        else:
+            G = tnseq_tools.Genes(self.ctrldata, self.annotation_path, minread=self.minread, reps=self.replicates, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus)
+            table = G.table()
+            stats = [GeneStats(gene.orf, gene.name, gene.desc, gene.k, int(table.n[i]), table.r[i], gene.s, gene.t) for (i, gene) in enumerate(G)]
 
-        N = len(G)
+        N = len(stats)
         self.progress_range(N)
         count = 0
-        pins = G.global_theta()
+        pins = float(sum(gene.k for gene in stats))/sum(gene.n for gene in stats)
         pnon = 1.0 - pins
         results = []
-        for gene in G:
-            if gene.n == 0:
+        for gene in stats:
+            n = gene.n
+            if n == 0:
                 results.append([gene, 0.0, 1.000])
             else:
                 B = 1.0/math.log(1.0/pnon)
-                u = math.log(gene.n*pins, 1.0/pnon)
-                exprun = tnseq_tools.ExpectedRuns(gene.n, pnon)
+                u = math.log(n*pins, 1.0/pnon)
+                exprun = tnseq_tools.ExpectedRuns(n, pnon)
                 pval = 1.0 - tnseq_tools.GumbelCDF(gene.r, u, B)
                 results.append([gene, exprun, pval])
 
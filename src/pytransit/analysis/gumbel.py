@@ -327,13 +327,14 @@ class GumbelMethod(base.SingleConditionMethod):
 
         G = tnseq_tools.Genes(self.ctrldata, self.annotation_path, minread=self.minread, reps=self.replicates, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus)
 
-        ii_good = numpy.array([self.good_orf(g) for g in G]) # Gets index of the genes that can be analyzed
+        table = G.table()
+        ii_good = self.good_orf(table) # Gets index of the genes that can be analyzed
 
-        K = G.local_insertions()[ii_good]
-        N = G.local_sites()[ii_good]
-        R = G.local_runs()[ii_good]
-        S = G.local_gap_span()[ii_good]
-        T = G.local_gene_span()[ii_good]
+        K = table.k[ii_good].astype(float)
+        N = table.n[ii_good].astype(float)
+        R = table.r[ii_good].astype(float)
+        S = table.s[ii_good].astype(float)
+        T = table.t[ii_good].astype(float)
 
         self.transit_message("Doing Regression")
         mu_s, temp, sigma_s = stat_tools.regress(R, S) # Linear regression to estimate mu_s, sigma_s for span data
@@ -344,7 +345,7 @@ class GumbelMethod(base.SingleConditionMethod):
 
         self.transit_message("Setting Initial Class")
         Z_sample = numpy.zeros((N_GOOD, self.samples))
-        Z = [self.classify(g.n, g.r, 0.5)   for g in G if self.good_orf(g)]
+        Z = [self.classify(n, r, 0.5) for (n, r) in zip(table.n[ii_good], table.r[ii_good])]
         Z_sample[:,0] = Z
         N_ESS = numpy.sum(Z_sample[:,0] == 1)
         
@@ -353,7 +354,7 @@ class GumbelMethod(base.SingleConditionMethod):
         phi_old = phi_start
         phi_new = 0.00
         
-        SIG = numpy.array([self.sigmoid(g.s, g.t) * scipy.stats.norm.pdf(g.r, mu_r*g.s, sigma_r) for g in G if self.good_orf(g)])
+        SIG = numpy.array([self.sigmoid(s, t) * scipy.stats.norm.pdf(r, mu_r*s, sigma_r) for (r, s, t) in zip(table.r[ii_good], table.s[ii_good], table.t[ii_good])])
 
 
         i = 1; count = 0;
@@ -415,8 +416,8 @@ class GumbelMethod(base.SingleConditionMethod):
         self.output.write("#%s\n" % "\t".join(columns))
         i = 0
         data = []
-        for g in G:
-            if not self.good_orf(g):
+        for j,g in enumerate(G):
+            if not ii_good[j]:
                 zbar = -1.0
             else:
                 zbar = ZBAR[i]
@@ -429,7 +430,7 @@ class GumbelMethod(base.SingleConditionMethod):
                 call = "NE"
             else:
                 call = "S"
-            data.append("%s\t%s\t%s\t%d\t%d\t%d\t%d\t%f\t%s\n" % (g.orf, g.name, g.desc, g.k, g.n, g.r, g.s, zbar, call))
+            data.append("%s\t%s\t%s\t%d\t%d\t%d\t%d\t%f\t%s\n" % (g.orf, g.name, g.desc, table.k[j], table.n[j], table.r[j], table.s[j], zbar, call))
         data.sort()
         for line in data:
             self.output.write(line)
@@ -456,7 +457,8 @@ class GumbelMethod(base.SingleConditionMethod):
         """ % (sys.argv[0])
 
     def good_orf(self, gene):
-        return (gene.n >= 3 and gene.t >= 150)
+        # Works on a Gene, or on the columns of a GeneTable
+        return (gene.n >= 3) & (gene.t >= 150)
 
     def classify(self, n,r,p):
         if n == 0: return 0
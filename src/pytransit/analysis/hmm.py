@@ -285,16 +285,18 @@ class HMMMethod(base.SingleConditionMethod):
         # Normalize data
         if self.normalization != "nonorm":
             self.transit_message("Normalizing using: %s" % self.normalization)
-            (data, factors) = norm_tools.normalize_data(data, self.normalization, self.ctrldata, self.annotation_path)
+            (data, factors) = norm_tools.normalize_data(data, self.normalization, self.ctrldata, self.annotation_path, position)
         
         # Do LOESS
         if self.LOESS: 
             self.transit_message("Performing LOESS Correction")
+            if data.dtype.kind != "f":
+                data = data.astype(numpy.float32)
             for j in range(K):
                 data[j] = stat_tools.loess_correction(position, data[j])
 
 
-        hash = transit_tools.get_pos_hash(self.annotation_path)
+        index = tnseq_tools.get_annotation_index(self.annotation_path)
         rv2info = transit_tools.get_gene_info(self.annotation_path)
 
         if len(self.ctrldata) > 1:
@@ -391,10 +393,11 @@ class HMMMethod(base.SingleConditionMethod):
 
         states = [int(Q_opt[t]) for t in range(T)]
         last_orf = ""
+        genes_at_sites = index.genes_at(position)
         for t in xrange(T):
             s_lab = label.get(states[t], "Unknown State")
             gamma_t = (alpha[:,t] * beta[:,t])/numpy.sum(alpha[:,t] * beta[:,t])
-            genes_at_site = hash.get(position[t], [""])
+            genes_at_site = genes_at_sites[t] or [""]
             genestr = ""
             if not (len(genes_at_site) == 1 and not genes_at_site[0]):
                 genestr = ",".join(["%s_(%s)" % (g,rv2info.get(g, "-")[0]) for g in genes_at_site])
@@ -247,12 +247,13 @@ class RankProductMethod(base.DualConditionMethod):
         if self.normalization != "none":
             self.transit_message("Normalizing using: %s" % self.normalization)
 
-            (data, factors) = norm_tools.normalize_data(data, self.normalization, self.ctrldata+self.expdata, self.annotation_path)           
+            (data, factors) = norm_tools.normalize_data(data, self.normalization, self.ctrldata+self.expdata, self.annotation_path, position)           
          
 
-        Gctrl= tnseq_tools.Genes(self.ctrldata + self.expdata, self.annotation_path, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus, data=data[:Kctrl,:], position=position)
-
-        Gexp= tnseq_tools.Genes(self.ctrldata + self.expdata, self.annotation_path, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus, data=data[Kctrl:,:], position=position)
+        # Map the sites to the genes once, and take views of each condition
+        G = tnseq_tools.Genes(self.ctrldata + self.expdata, self.annotation_path, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus, data=data, position=position)
+        Gctrl = G.select(slice(None, Kctrl))
+        Gexp = G.select(slice(Kctrl, None))
 
 
         Ngenes = len(Gctrl)
@@ -340,29 +340,45 @@ class ResamplingMethod(base.DualConditionMethod):
         Kexp = len(self.expdata)
         #Get orf data
         self.transit_message("Getting Data")
-        (data, position) = tnseq_tools.get_data(self.ctrldata+self.expdata)
+        stream_factors = None
+        if tnseq_tools.default_stream:
+            if self.LOESS:
+                self.transit_message("The LOESS correction needs whole datasets. Loading them in memory.")
+            else:
+                stream_factors = norm_tools.stream_factors(self.ctrldata+self.expdata, self.normalization, self.annotation_path)
+                if stream_factors is None:
+                    self.transit_message("The %s normalization needs all the datasets at once. Loading them in memory." % self.normalization)
+
+        if stream_factors is not None:
+            # Read the datasets in blocks; each gene is resampled once all its sites are read.
+            G = tnseq_tools.iter_genes(self.ctrldata + self.expdata, self.annotation_path, factors=stream_factors, minread=0, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus)
+            N = len(tnseq_tools.get_annotation(self.annotation_path))
+        else:
+            (data, position) = tnseq_tools.get_data(self.ctrldata+self.expdata)
 
-        (K,N) = data.shape
+            (K,N) = data.shape
 
 
-        if self.normalization != "nonorm":
-            self.transit_message("Normalizing using: %s" % self.normalization)
-            (data, factors) = norm_tools.normalize_data(data, self.normalization, self.ctrldata+self.expdata, self.annotation_path)
+            if self.normalization != "nonorm":
+                self.transit_message("Normalizing using: %s" % self.normalization)
+                (data, factors) = norm_tools.normalize_data(data, self.normalization, self.ctrldata+self.expdata, self.annotation_path, position)
 
-        if self.LOESS:
-            self.transit_message("Performing LOESS Correction")
-            for j in range(K):
-                data[j] = stat_tools.loess_correction(position, data[j])
+            if self.LOESS:
+                self.transit_message("Performing LOESS Correction")
+                if data.dtype.kind != "f":
+                    data = data.astype(numpy.float32)
+                for j in range(K):
+                    data[j] = stat_tools.loess_correction(position, data[j])
 
 
-        G = tnseq_tools.Genes(self.ctrldata + self.expdata, self.annotation_path, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus, data=data, position=position)
+            G = tnseq_tools.Genes(self.ctrldata + self.expdata, self.annotation_path, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus, data=data, position=position)
+            N = len(G)
 
         #G = tnseq_tools.Genes(self.ctrldata+self.expdata, self.annotation_path, norm=self.normalization, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus)
 
 
         #Resampling
         data = []
-        N = len(G)
         count = 0
         self.progress_range(N)
         for gene in G:
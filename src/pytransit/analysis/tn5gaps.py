@@ -235,15 +235,16 @@ class Tn5GapsMethod(base.SingleConditionMethod):
         self.transit_message("Getting data (May take a while)")
         genes_obj = tnseq_tools.Genes(self.ctrldata, self.annotation_path, ignoreCodon=self.ignoreCodon, nterm=self.NTerminus, cterm=self.CTerminus)
         
-        # Combine all wigs
-        (data,position) = tnseq_tools.get_data_zero_fill(self.ctrldata)
+        # Combine all wigs (sparse, as most genomic positions have no insertions)
+        (data,position) = tnseq_tools.get_data_zero_fill(self.ctrldata, sparse=True)
         combined = tnseq_tools.combine_replicates(data, method=self.replicates)
-        combined[combined < self.minread] = 0
+        combined.data[combined.data < self.minread] = 0
+        combined.eliminate_zeros()
         counts = combined
-        counts[counts > 0] = 1
-        num_sites = counts.size
+        counts.data[:] = 1
+        num_sites = counts.shape[1]
         
-        pins = numpy.mean(counts)
+        pins = counts.nnz/float(num_sites)
         pnon = 1.0 - pins
 
         # Calculate stats of runs
@@ -255,13 +256,14 @@ class Tn5GapsMethod(base.SingleConditionMethod):
         # Get the runs
         self.transit_message("Getting non-insertion runs in genome")
         run_arr = tnseq_tools.runs_w_info(counts)
-        pos_hash = transit_tools.get_pos_hash(self.annotation_path)
+        pos_hash = tnseq_tools.get_annotation_index(self.annotation_path)
 
         # Finally, calculate the results
         self.transit_message("Running Tn5 gaps method")
         results_per_gene = {}
-        for gene in genes_obj.genes:
-            results_per_gene[gene.orf] = [gene.orf, gene.name, gene.desc, gene.k, gene.n, gene.r, 0, 0, 1]
+        table = genes_obj.table()
+        for (i, gene) in enumerate(genes_obj.genes):
+            results_per_gene[gene.orf] = [gene.orf, gene.name, gene.desc, table.k[i], table.n[i], table.r[i], 0, 0, 1]
         
         N = len(run_arr)
         count = 0
@@ -284,7 +286,8 @@ class Tn5GapsMethod(base.SingleConditionMethod):
                 curr_inter_sz = curr_val[6]
                 curr_len = curr_val[7]
                 if inter_sz > curr_inter_sz:
-                    results_per_gene[gene.orf] = [gene.orf, gene.name, gene.desc, gene.k, gene.n, gene.r, inter_sz, run_len, pval]
+                    i = genes_obj.orf2index[gene.orf]
+                    results_per_gene[gene.orf] = [gene.orf, gene.name, gene.desc, table.k[i], table.n[i], table.r[i], inter_sz, run_len, pval]
             self.progress_update("tn5gaps", count)
             self.transit_message_inplace("Running Tn5Gaps method... %1.1f%%" % (100.0*count/N))
                 
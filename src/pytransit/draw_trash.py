@@ -252,6 +252,29 @@ def get_dynamic_height(N):
     return (canvas_h)
 
 
+def first_genes(index, position, default="non-coding"):
+    """Returns the first gene containing each coordinate, or the default.
+
+    Arguments:
+        index: tnseq_tools.AnnotationIndex, looked up for all the coordinates
+            at once, or a dictionary of lists of genes keyed by coordinate.
+        position (numpy array): Coordinates of the sites.
+        default (str): Name given to the sites outside of the genes.
+
+    Returns:
+        list: List with the first gene of each coordinate.
+    """
+    if not hasattr(index, "lookup"):
+        return [index.get(pos, [default])[0] for pos in position]
+    genes = [default] * len(position)
+    (ii_site, ii_gene) = index.lookup(position)
+    # Pairs are sorted by site, and then by the order of the genes.
+    ii_first = numpy.flatnonzero(numpy.diff(numpy.concatenate(([-1], ii_site))) != 0)
+    for (i, g) in zip(ii_site[ii_first], ii_gene[ii_first]):
+        genes[i] = index.orf[g]
+    return genes
+
+
 def draw_canvas(fulldata, position, hash, orf2data, feature_hashes, feature_data, labels=[], min_read=0, scale=[500], globalScale = False, start=1, end=500, canvas_h=-1, canvas_w=1000):
     
 
@@ -271,24 +294,21 @@ def draw_canvas(fulldata, position, hash, orf2data, feature_hashes, feature_data
     TA_SITES = []
     READS = []
     nc_count = 1
+    # The genes of the sites in view are looked up once, for all the datasets.
+    position = numpy.asarray(position)
+    ii_view = numpy.flatnonzero((position >= start) & (position <= end))
+    view_position = position[ii_view]
+    for (pos, gene) in zip(view_position, first_genes(hash, view_position)):
+        if gene == "non-coding" and len(GENES) > 0 and not GENES[-1].startswith("non-coding"):
+            gene+="_%d" % nc_count
+            nc_count +=1
+        if gene not in GENES: GENES.append(gene)
+        TA_SITES.append(pos)
+    for f,f_hash in enumerate(feature_hashes):
+        for feat in first_genes(f_hash, view_position):
+            if feat not in FEATURES[f]: FEATURES[f].append(feat)
     for j,data in enumerate(fulldata):
-        #print j
-        temp = []
-        for i,read in enumerate(data):
-            pos = position[i]
-            if start <= pos <= end:
-                gene = hash.get(pos,["non-coding"])[0]
-                if gene == "non-coding" and len(GENES) > 0 and not GENES[-1].startswith("non-coding"):
-                    gene+="_%d" % nc_count
-                    nc_count +=1
-                if j ==0:
-                    if gene not in GENES: GENES.append(gene)
-                    TA_SITES.append(pos)
-                    for f,f_hash in enumerate(feature_hashes):
-                        feat = f_hash.get(pos,["non-coding"])[0]
-                        if feat not in FEATURES[f]: FEATURES[f].append(feat)
-                temp.append(read)
-        READS.append(temp)
+        READS.append(list(numpy.asarray(data)[ii_view]))
 
     max_reads = []
     if globalScale:
@@ -1,20 +1,55 @@
 import sys
+import os
+import hashlib
+import tempfile
+import multiprocessing
 import numpy
 import scipy.stats
 import scipy.optimize
+import scipy.special
+import scipy.signal
+import scipy.sparse
 import warnings
 
 import tnseq_tools
 
+# Results of the slow or stochastic normalization methods (see
+# NormMethod.cacheable) are cached as .npz files in tnseq_tools.cache_dir, keyed
+# by the content of the read-counts and the method, so that later runs (e.g.
+# the QC window or the combined wig export) reuse them. Turned off, as the
+# tnseq_tools cache, by the TRANSIT_NO_CACHE environment variable.
+use_cache = not os.environ.get("TRANSIT_NO_CACHE")
+
+# Path to a file of precomputed normalization factors to use instead of
+# computing them, and path to a file to write the computed factors to (see
+# read_factors). Set from the console with "--norm-factors <file>" and
+# "--save-norm-factors <file>".
+factors_file = None
+save_factors_file = None
 
 class NormMethod:
     name = "undefined"
+    # Whether normalize() accepts scipy.sparse read-counts. Other methods are
+    # given a dense copy of the data by normalize_data().
+    supports_sparse = False
+    # Whether normalize() returns the data multiplied by the returned (K,1)
+    # factors, so that the factors alone can be stored and reused. These
+    # methods also define factors(data, wigList, annotationPath).
+    scales_data = False
+    # Whether normalize_data() caches the results of the method (for slow or
+    # stochastic methods; see use_cache).
+    cacheable = False
+    # Whether the factors of each dataset depend only on its own read-counts,
+    # so they can be computed one dataset at a time (see stream_factors).
+    per_dataset = False
     @staticmethod
     def normalize():
         raise NotImplemented
 
 class NZMeanNorm(NormMethod):
     name = "nzmean"
+    supports_sparse = True
+    scales_data = True
 
     @staticmethod
     def normalize(data, wigList=[], annotationPath=""):
@@ -42,21 +77,29 @@ class NZMeanNorm(NormMethod):
         .. seealso:: :class:`normalize_data`
 
         """
+        factors = NZMeanNorm.factors(data, wigList, annotationPath)
+        data = scale_rows(data, factors)
+        return (data, factors)
+
+    @staticmethod
+    def factors(data, wigList=[], annotationPath="", position=None):
+        """Returns the (K,1) normalization factors of the NZMean method (see :func:`normalize`)."""
         (K,N) = data.shape
-        total_hits = numpy.sum(data,1)
-        TAs_hit = numpy.sum(data > 0, 1)
+        total_hits = numpy.asarray(data.sum(1), dtype=float).ravel()
+        TAs_hit = numpy.asarray((data > 0).sum(1)).ravel()
         mean_hits = total_hits/TAs_hit
         grand_total = numpy.sum(mean_hits)
         grand_mean = grand_total/float(K)
         factors = numpy.zeros((K,1))
         factors[:,0] = grand_mean/mean_hits
-        data = factors * data
-        return (data, factors)
+        return factors
 
 
 
 class TotReadsNorm(NormMethod):
     name = "totreads"
+    supports_sparse = True
+    scales_data = True
 
     @staticmethod
     def normalize(data, wigList=[], annotationPath=""):
@@ -85,20 +128,29 @@ class TotReadsNorm(NormMethod):
         .. seealso:: :class:`normalize_data`
 
         """
+        factors = TotReadsNorm.factors(data, wigList, annotationPath)
+        data = scale_rows(data, factors)
+        return (data, factors)
+
+    @staticmethod
+    def factors(data, wigList=[], annotationPath="", position=None):
+        """Returns the (K,1) normalization factors of the totreads method (see :func:`normalize`)."""
         (K,N) = data.shape
-        total_hits = numpy.sum(data,1)
+        total_hits = numpy.asarray(data.sum(1), dtype=float).ravel()
         TAs = float(N)
         mean_hits = total_hits/TAs
         grand_total = numpy.sum(mean_hits)
         grand_mean = grand_total/float(K)
         factors = numpy.zeros((K,1))
         factors[:,0] = grand_mean/mean_hits
-        data = factors * data
-        return (data, factors)
+        return factors
 
 
 class TTRNorm(NormMethod):
     name = "emphist"
+    supports_sparse = True
+    scales_data = True
+    per_dataset = True
 
     def empirical_theta(X):
         """Calculates the observed density of the data.
@@ -126,6 +178,8 @@ class TTRNorm(NormMethod):
 
         .. seealso:: :class:`TTR_factors`
         """
+        if scipy.sparse.issparse(X):
+            return numpy.sum(X.data > 0)/float(numpy.prod(X.shape))
         return numpy.mean(X > 0)
 
     def trimmed_empirical_mu(X, t=0.05):
@@ -154,6 +208,8 @@ class TTRNorm(NormMethod):
 
         .. seealso:: :class:`TTR_factors`
         """
+        if scipy.sparse.issparse(X):
+            X = X.data
         return scipy.stats.trim_mean(X[X > 0], t)
 
 
@@ -187,18 +243,24 @@ class TTRNorm(NormMethod):
 
         .. seealso:: :class:`normalize_data`
         """
-        K = len(data)
-        N = len(data[0])
+        factors = TTRNorm.factors(data, wigList, annotationPath, thetaEst, muEst, target)
+        data = scale_rows(data, factors)
+        return (data, factors)
+
+    @staticmethod
+    def factors(data, wigList=[], annotationPath="", thetaEst=empirical_theta, muEst=trimmed_empirical_mu, target=100.0, position=None):
+        """Returns the (K,1) normalization factors of the TTR method (see :func:`normalize`)."""
+        (K,N) = data.shape
 
         factors = numpy.zeros((K,1))
         for j in range(K):
             factors[j] = float(target)/(thetaEst(data[j]) * muEst(data[j]))
-        data = factors * data
-        return (data, factors)
+        return factors
 
 
 class EmpHistNorm(NormMethod):
     name = "emphist"
+    scales_data = True
 
     @staticmethod
     def Fzinfnb(params, args):
@@ -211,12 +273,20 @@ class EmpHistNorm(NormMethod):
         return negLL
 
     @staticmethod
-    def normalize(data, wigList=[], annotationPath=""):
+    def normalize(data, wigList=[], annotationPath="", position=None):
         """Returns the normalized data, using the empirical hist method.
 
+        The factors are found from the mode of the log-fold-changes of the read
+        sums of each gene (see :func:`gene_read_sums` and :func:`kde_peak`)
+        with respect to the first dataset.
+
         Arguments:
+            data (numpy array): (K,N) numpy array defining read-counts at N sites
+                for K datasets.
             wigList (list): List of paths to wig formatted datasets.
             annotationPath (str): Path to annotation in .prot_table or GFF3 format.
+            position (numpy array): Coordinates of the N sites. Read from the
+                first wig file if not given.
 
         Returns:
             numpy array: Array with the normalization factors for the emphist method.
@@ -236,40 +306,35 @@ class EmpHistNorm(NormMethod):
         .. seealso:: :class:`normalize_data`
         """
 
-        G = tnseq_tools.Genes(wigList, annotationPath)
-        K = len(wigList)
-        temp = []
-        for j in range(K):
-            reads_per_gene = []
-            for gene in G:
-                tempdata = numpy.array(gene.reads)
-                if len(tempdata[0]) > 0:
-                    reads_per_gene.append(numpy.sum(tempdata[j,:]))
-            temp.append(reads_per_gene)
+        factors = EmpHistNorm.factors(data, wigList, annotationPath, position)
+        data = factors * data
+        return (data, factors)
 
-        temp = numpy.array(temp)
+    @staticmethod
+    def factors(data, wigList=[], annotationPath="", position=None):
+        """Returns the (K,1) normalization factors of the emphist method (see :func:`normalize`)."""
+        (K,N) = data.shape
+        if position is None:
+            if not wigList:
+                raise ValueError("The emphist method requires the coordinates of the sites, or the paths to the wig files.")
+            position = tnseq_tools.read_wig(wigList[0])[0]
+        temp = gene_read_sums(data, position, annotationPath)
 
         factors = numpy.ones((K,1))
         for j in range(1, K):
             ii_good  = numpy.logical_and(temp[0,:] > 0,  temp[j,:] > 0)
             logFC = numpy.log(temp[j,ii_good]/temp[0,ii_good])
-            mean = numpy.mean(logFC)
-            std = numpy.sqrt(numpy.var(logFC))
-            X = numpy.linspace(mean - (5*std),  mean + (std*5), 50000)
-            R = scipy.stats.gaussian_kde(logFC)
-            Y = R(X)
-            peakLogFC = X[Y.argmax()]
+            peakLogFC = kde_peak(logFC)
             if peakLogFC < 0:
                 factors[j,0] = numpy.exp(abs(peakLogFC))
             else:
                 factors[j,0] = 1.0/numpy.exp(abs(peakLogFC))
-
-        data = factors * data
-        return (data, factors)
+        return factors
 
 
 class AdaptiveBGCNorm(NormMethod):
     name = "aBGC"
+    cacheable = True
 
     def ecdf(S, x):
         """Calculates an empirical CDF of the given data."""
@@ -283,15 +348,28 @@ class AdaptiveBGCNorm(NormMethod):
             return x
 
     @staticmethod
-    def normalize(data, wigList=[], annotationPath="", doTotReads = True, bgsamples = 200000):
+    def normalize(data, wigList=[], annotationPath="", doTotReads = True, bgsamples = 200000, workers=None, seed=None, patience=None, callback=None):
         """Returns the normalized data using the aBGC method.
 
+        For each dataset, the trimmed mean used to fit the beta-geometric
+        distribution is chosen from a grid of trimming fractions by goodness of
+        fit (see :func:`abgc_fraction_gof`). The fractions of all datasets are
+        evaluated in a process pool, each with its own random stream derived
+        from the seed, so the results do not depend on the number of workers.
 
         Arguments:
             data (numpy array): (K,N) numpy array defining read-counts at N sites
                 for K datasets.
             doTotReads (bool):  Boolean specifying whether to do TTR normalization as well.
             bgsamples (int): Integeer specifying how many samples to take.
+            workers (int): Number of worker processes. Defaults to the module-level
+                :data:`tnseq_tools.default_workers` setting.
+            seed (int): Seed of the random streams. Defaults to a number drawn from
+                numpy.random, so numpy.random.seed() makes the results reproducible.
+            patience (int): If given, the search for a dataset stops once this many
+                consecutive fractions fail to improve the best goodness of fit.
+            callback (function): Function called as callback(j, frac, GOF) with the
+                goodness of fit of each fraction evaluated for dataset j.
 
         Returns:
             numpy array: Array with the normalized data.
@@ -315,47 +393,50 @@ class AdaptiveBGCNorm(NormMethod):
         norm_data = numpy.zeros(data.shape)
         S = bgsamples
         F = [i/100.0 for i in range(0,31) if i % 2 == 0]
-        BGC = []
-        param_list = []
-        bgc_factors = []
+        if workers is None:
+            workers = tnseq_tools.default_workers
+        if seed is None:
+            seed = numpy.random.randint(0, 2**31-1)
+        seeds = numpy.random.RandomState(seed).randint(0, 2**31-1, size=(K, len(F)+1))
+
+        nzdata = []
         for j in range(K):
+            nz = data[j][data[j] > 0].astype(float)
+            nz.sort()
+            nzdata.append(nz)
+
+        # Fractions are evaluated in rounds (all at once without patience), so
+        # that the search of each dataset can stop after any round.
+        round_size = len(F) if patience is None else max(workers, 1)
+        GOF_lists = [[] for j in range(K)]
+        next_frac = [0]*K
+        active = range(K)
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        try:
+            while active:
+                tasks = []
+                for j in active:
+                    for f in range(next_frac[j], min(next_frac[j] + round_size, len(F))):
+                        tasks.append((j, nzdata[j], F[f], S, seeds[j,f]))
+                    next_frac[j] = min(next_frac[j] + round_size, len(F))
+                results = pool.map(_abgc_fraction_task, tasks) if pool else map(_abgc_fraction_task, tasks)
+                for (j, result) in results:
+                    GOF_lists[j].append(result)
+                    if callback:
+                        callback(j, result[1], result[0])
+                active = [j for j in active if next_frac[j] < len(F) and not _abgc_stalled(GOF_lists[j], patience)]
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
 
-            nzdata = data[j][data[j] > 0]
-            nzdata.sort()
-            Nall = len(data[j])
-            Nnz = len(nzdata)
-            GOF_list = []
-            for frac in F:
-                tQ = numpy.arange(0,Nnz)/float(Nnz)
-                rho = 1.0/(scipy.stats.trim_mean(nzdata, frac))
-                rho_to_fit = rho
-
-                try:
-                    A = (numpy.sum(numpy.power(numpy.log(1.0-tQ),2)))/(numpy.sum(nzdata*numpy.log(1.0-tQ)))
-                    Kp = (2.0 * numpy.exp(A) - 1)   /(numpy.exp(A) + rho - 1)
-                    temp = scipy.stats.geom.rvs(scipy.stats.beta.rvs(Kp*rho, Kp*(1-rho), size=S), size=S)
-                    bgc_factors.append((rho, Kp))
-                except Except as e:
-                    print "aBGC Error:", str(e)
-                    print "%rho=s\tKp=%s\tA=%s" % (rho, Kp, A)
-                    temp = scipy.stats.geom.rvs(0.01, size=S)
-
-
-                corrected_nzdata = [cleaninfgeom(scipy.stats.geom.ppf(ecdf(temp, x), rho_to_fit), rho_to_fit) for x in nzdata]
-                corrected_nzmean = numpy.mean(corrected_nzdata)
-
-                Fp = scipy.stats.geom.ppf(numpy.arange(1,Nnz+1)/float(Nnz), 1.0/corrected_nzmean)
-                ii_inf = Fp == float("inf")
-                Fp[ii_inf] = max(Fp[~ii_inf]) + 100
-                ch2_indiv = numpy.power(corrected_nzdata- Fp, 2)/ Fp
-                GOF = max(ch2_indiv)
-                GOF_list.append((GOF, frac, rho_to_fit, Kp))
-
-            gof, frac, best_rho, best_Kp = sorted(GOF_list)[0]
-            BGsample = scipy.stats.geom.rvs(scipy.stats.beta.rvs(best_Kp*best_rho, best_Kp*(1-best_rho), size=S), size=S)
-            #BGC.append(dict([(x, removeinf(scipy.stats.geom.ppf(ecdf(temp, x), best_rho), best_rho)) for x in data[j]]))
-            for i in range(N):
-                norm_data[j,i] = cleaninfgeom(scipy.stats.geom.ppf(ecdf(BGsample, data[j,i]), best_rho), best_rho)
+        bgc_factors = []
+        for j in range(K):
+            bgc_factors.extend([(rho, Kp) for (GOF, frac, rho, Kp) in GOF_lists[j]])
+            gof, frac, best_rho, best_Kp = sorted(GOF_lists[j])[0]
+            random_state = numpy.random.RandomState(seeds[j,-1])
+            BGsample = scipy.stats.geom.rvs(scipy.stats.beta.rvs(best_Kp*best_rho, best_Kp*(1-best_rho), size=S, random_state=random_state), size=S, random_state=random_state)
+            norm_data[j] = ecdf_geom_ppf(BGsample, data[j], best_rho)
 
         if doTotReads:
             (norm_data, factors) = TTRNorm.normalize(norm_data)
@@ -365,9 +446,12 @@ class AdaptiveBGCNorm(NormMethod):
 
 class ZeroInflatedNBNorm(NormMethod):
     name = "zinfb"
+    scales_data = True
+    cacheable = True
+    per_dataset = True
 
     @staticmethod
-    def normalize(data, wigList=[], annotationPath=""):
+    def normalize(data, wigList=[], annotationPath="", workers=None):
         """Returns the normalization factors for the data using the zero-inflated
         negative binomial method.
 
@@ -375,6 +459,7 @@ class ZeroInflatedNBNorm(NormMethod):
         Arguments:
             data (numpy array): (K,N) numpy array defining read-counts at N sites
                 for K datasets.
+            workers (int): Number of worker processes (see :func:`zinfnb_factors`).
 
         Returns:
             numpy array: Array with the normalization factors for the zinfnb method.
@@ -393,21 +478,15 @@ class ZeroInflatedNBNorm(NormMethod):
 
         .. seealso:: :class:`normalize_data`
         """
-        N = len(data)
-        G = len(data[0])
-
-        factors = numpy.zeros((N, 1))
-        for j in range(N):
-            initParams = [0.3, 10, 0.5]
-            M = "L-BFGS-B"
-            Fdata = numpy.array(data[j])
-            results = scipy.optimize.minimize(Fzinfnb, initParams, args=(Fdata,), method=M, bounds=[(0.0001, 0.9999),(0.0001, None),(0.0001, 0.9999)])
-            pi, n, p = results.x
-            mu = n*(1-p)/p
-            factors[j,0] = 1.0/mu
+        factors = zinfnb_factors(data, workers)
         data = factors * data
         return (data, factors)
 
+    @staticmethod
+    def factors(data, wigList=[], annotationPath="", workers=None, position=None):
+        """Returns the (K,1) normalization factors of the zinfnb method (see :func:`zinfnb_factors`)."""
+        return zinfnb_factors(data, workers)
+
 
 class QuantileNorm(NormMethod):
     name = "quantile"
@@ -416,6 +495,13 @@ class QuantileNorm(NormMethod):
     def normalize(data, wigList=[], annotationPath=""):
         """Performs Quantile Normalization as described by Bolstad et al. 2003
 
+        Each read-count is replaced by the mean over the datasets of the values
+        with the same rank. Tied read-counts share the value of their lowest
+        rank (as in scipy.stats.rankdata with method='min'), so the sites without
+        insertions stay at zero. Each dataset is sorted once; the sorting
+        permutations are kept (as int32) and give both the mean distribution and
+        the ranks.
+
         Arguments:
             data (numpy array): (K,N) numpy array defining read-counts at N sites
                 for K datasets.
@@ -436,22 +522,21 @@ class QuantileNorm(NormMethod):
         .. seealso:: :class:`normalize_data`
 
         """
-        N = len(data)
-        G = len(data[0])
-        #Sort columns
-        s_data = numpy.array([sorted(col) for col in data])
-        #Get ranks of original data
-        ranks = numpy.zeros(data.shape, dtype=int)
-        for j in range(N):
-            ranks[j,:] = scipy.stats.rankdata(data[j], method='dense')
-        #Get empirical distribution
-        ranked_means = numpy.mean(s_data,0)
-        #Create dictionary of rank to new empirical values
-        rank2count = dict([(r,c) for (r,c) in zip(scipy.stats.rankdata(ranked_means, method='dense'), ranked_means)])
-        #Assign values
+        (K,N) = data.shape
+        #Get empirical distribution (mean of the sorted datasets), sorting each dataset once
+        order = numpy.zeros(data.shape, dtype=numpy.int32 if N < 2**31 else int)
+        ranked_means = numpy.zeros(N)
+        for j in range(K):
+            order[j] = numpy.argsort(data[j], kind="mergesort")
+            ranked_means += data[j][order[j]]
+        ranked_means /= float(K)
+        #Assign values: tied read-counts get the value of their lowest rank
         norm_data = numpy.zeros(data.shape)
-        for i in range(G):
-            norm_data[:,i] = [rank2count[ranks[j,i]] for j in range(N)]
+        for j in range(K):
+            sorted_data = data[j][order[j]]
+            is_first = numpy.concatenate(([True], sorted_data[1:] != sorted_data[:-1]))
+            first = numpy.flatnonzero(is_first)
+            norm_data[j, order[j]] = ranked_means[first][numpy.cumsum(is_first) - 1]
         return (norm_data, numpy.ones(1))
 
 
@@ -460,6 +545,7 @@ class QuantileNorm(NormMethod):
 
 class BetaGeomNorm(NormMethod):
     name = "betageom"
+    cacheable = True
 
     def ecdf(S, x):
         """Calculates an empirical CDF of the given data."""
@@ -526,8 +612,7 @@ class BetaGeomNorm(NormMethod):
                 print str(e)
                 BGsample = scipy.stats.geom.rvs(rho, size=bgsamples)
 
-            for i in range(N):
-                norm_data[j,i] = cleaninfgeom(scipy.stats.geom.ppf(ecdf(BGsample, data[j,i]), 1.0/grand_mean), 1.0/grand_mean)
+            norm_data[j] = ecdf_geom_ppf(BGsample, data[j], 1.0/grand_mean)
 
         if doTTR:
             (norm_data, factors) = TTRNorm.normalize(norm_data)
@@ -536,6 +621,7 @@ class BetaGeomNorm(NormMethod):
 
 class NoNorm(NormMethod):
     name = "nonorm"
+    supports_sparse = True
     @staticmethod
     def normalize(data, wigList=[], annotationPath=""):
         return (data, numpy.ones(1))
@@ -554,7 +640,7 @@ methods["emphist"] = EmpHistNorm
 
 
 #########################
-def normalize_data(data, method="nonorm", wigList=[], annotationPath=""):
+def normalize_data(data, method="nonorm", wigList=[], annotationPath="", position=None):
     """Normalizes the numpy array by the given normalization method.
 
     Arguments:
@@ -563,6 +649,8 @@ def normalize_data(data, method="nonorm", wigList=[], annotationPath=""):
         method (str): Name of the desired normalization method.
         wigList (list): List of paths for the desired wig-formatted datasets.
         annotationPath (str): Path to the prot_table annotation file.
+        position (numpy array): Coordinates of the N sites (used by emphist,
+            which otherwise reads them from the first wig file).
 
     Returns:
         numpy array: Array with the normalized data.
@@ -585,14 +673,287 @@ def normalize_data(data, method="nonorm", wigList=[], annotationPath=""):
 
     .. note:: Some normalization methods require the wigList and annotationPath arguments.
 
+    .. note:: The nonorm, TTR, nzmean and totreads methods keep scipy.sparse read-counts
+        sparse. Other methods are given (and return) a dense copy.
+
+    .. note:: Compact read-counts (e.g. uint32, see :func:`pytransit.tnseq_tools.get_data`)
+        are normalized in float64, and the normalized data is returned as float32.
+
+    .. note:: The results of the slow or stochastic methods (betageom, aBGC and zinfnb)
+        are cached (see :data:`use_cache`). If :data:`factors_file` is set and lists
+        all the datasets in wigList, its factors are used instead of computing them
+        (only for the methods that scale the data, see NormMethod.scales_data).
+
     """
     factors = []
-    if method in methods:
-        return methods[method].normalize(data, wigList, annotationPath)
-    else:
+    if method not in methods:
         warnstr = "Normalization method '%s' is unknown. Read-counts were not normalized." % (method)
         warnings.warn(warnstr)
-    return methods["nonorm"].normalize(data, wigList, annotationPath)
+        method = "nonorm"
+    if scipy.sparse.issparse(data) and not methods[method].supports_sparse:
+        data = data.toarray()
+    compact = data.dtype.itemsize <= 4
+    if compact and method == "nonorm":
+        return (data.astype(numpy.float32), numpy.ones(1))
+
+    M = methods[method]
+    # Methods that only scale the data work on the integer counts directly, so
+    # compact data is never copied to float64.
+    if compact and not (M.scales_data and not scipy.sparse.issparse(data)):
+        data = data.astype(float)
+    given_factors = None
+    if factors_file and wigList and method != "nonorm":
+        if not M.scales_data:
+            warnings.warn("The %s method does not normalize with factors. The factors file '%s' was not used." % (method, factors_file))
+        else:
+            given_factors = lookup_factors(read_factors(factors_file), wigList)
+            if given_factors is None:
+                warnings.warn("The factors file '%s' does not include all the datasets. Computing the %s factors instead." % (factors_file, method))
+    normed = None
+    if given_factors is not None:
+        factors = given_factors
+    else:
+        cache_path = None
+        cached = None
+        if use_cache and M.cacheable and not scipy.sparse.issparse(data):
+            cache_path = os.path.join(tnseq_tools.cache_dir, norm_cache_key(data, method, annotationPath) + "_norm.npz")
+            cached = _load_norm_cache(cache_path, M)
+        if cached is not None:
+            (normed, factors) = cached
+        else:
+            if M.scales_data:
+                factors = M.factors(data, wigList, annotationPath, position=position)
+            else:
+                (normed, factors) = M.normalize(data, wigList, annotationPath)
+            if cache_path:
+                _save_norm_cache(cache_path, normed, factors, M)
+        save_factors(wigList, method, factors)
+
+    if not M.scales_data:
+        data = normed
+    elif compact and not scipy.sparse.issparse(data):
+        normed = numpy.empty(data.shape, dtype=tnseq_tools.COMPACT_NORM_DTYPE)
+        numpy.multiply(data, numpy.reshape(factors, (-1,1)), out=normed, casting="unsafe")
+        return (normed, factors)
+    else:
+        data = scale_rows(data, factors)
+    if compact:
+        data = data.astype(numpy.float32)
+    return (data, factors)
+
+def norm_cache_key(data, method, annotationPath=""):
+    """Returns the key identifying the cached normalization of the given data.
+
+    The key is derived from the content of the read-counts, the method, and
+    the path and modification time of the annotation (if any).
+
+    Arguments:
+        data (numpy array): (K,N) numpy array defining read-counts at N sites
+            for K datasets.
+        method (str): Name of the normalization method.
+        annotationPath (str): Path to the annotation file.
+
+    Returns:
+        str: Hexadecimal string with the cache key.
+    """
+    h = hashlib.sha1()
+    h.update(("%s|%s|%s" % (method, data.shape, data.dtype)).encode("utf-8"))
+    if annotationPath and os.path.exists(annotationPath):
+        h.update(("|%s|%r" % (os.path.abspath(annotationPath), os.path.getmtime(annotationPath))).encode("utf-8"))
+    for row in data:
+        h.update(numpy.ascontiguousarray(row).view(numpy.uint8))
+    return h.hexdigest()
+
+#
+
+def _load_norm_cache(path, M):
+    """Returns the cached normalization, or None if it cannot be read.
+
+    Arguments:
+        path (str): Path to the .npz file written by :func:`_save_norm_cache`.
+        M (NormMethod): Normalization method.
+
+    Returns:
+        tuple: Normalized data (None for methods that scale the data) and factors.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        cached = numpy.load(path)
+        try:
+            factors = cached["factors"]
+            tnseq_tools.touch_cache(path)
+            if M.scales_data:
+                return (None, factors)
+            return (cached["data"], factors)
+        finally:
+            cached.close()
+    except (IOError, ValueError, KeyError) as e:
+        warnings.warn("Could not read the cached normalization '%s': %s" % (path, e))
+        return None
+
+#
+
+def _save_norm_cache(path, data, factors, M):
+    """Writes the normalization of the data to the cache (see :func:`_load_norm_cache`).
+
+    Only the factors are stored for methods that scale the data.
+
+    Arguments:
+        path (str): Path to the .npz file.
+        data (numpy array): (K,N) numpy array of normalized read-counts (None
+            for methods that scale the data).
+        factors (numpy array): Normalization factors.
+        M (NormMethod): Normalization method.
+    """
+    arrays = dict(factors=numpy.asarray(factors))
+    if not M.scales_data:
+        arrays["data"] = data
+    cache_dir = os.path.dirname(path)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write to a temporary file first so other processes never see partial files.
+        (fd, tmp_path) = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            numpy.savez(tmp_file, **arrays)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        warnings.warn("Could not write the cached normalization '%s': %s" % (path, e))
+    tnseq_tools.prune_cache()
+
+#
+
+def read_factors(path):
+    """Returns the normalization factors in the given file, keyed by dataset.
+
+    Each line of the file has the path of a wig file and its factor, separated
+    by a tab. Lines starting with '#' are ignored.
+
+    Arguments:
+        path (str): Path to the factors file.
+
+    Returns:
+        dict: Dictionary of absolute path of the datasets to their factor.
+
+    .. seealso:: :class:`write_factors` :class:`lookup_factors`
+    """
+    factors = {}
+    for line in open(path):
+        if line.startswith("#") or not line.strip(): continue
+        tmp = line.rstrip("\n").split("\t")
+        if len(tmp) < 2:
+            raise ValueError("Line '%s' of the factors file '%s' does not have a path and a factor." % (line.strip(), path))
+        factors[os.path.abspath(tmp[0])] = float(tmp[1])
+    return factors
+
+#
+
+def lookup_factors(factors, wigList):
+    """Returns the factors of the given datasets, as a (K,1) numpy array.
+
+    Datasets are matched by absolute path, or else (with a warning) by file
+    name, if exactly one dataset in the file has that name.
+
+    Arguments:
+        factors (dict): Dictionary of dataset path to factor (see :func:`read_factors`).
+        wigList (list): List of paths to the K datasets.
+
+    Returns:
+        numpy array: (K,1) numpy array of factors, or None if a dataset is missing.
+    """
+    by_name = {}
+    for (path, f) in factors.items():
+        by_name.setdefault(os.path.basename(path), []).append((path, f))
+    result = numpy.zeros((len(wigList), 1))
+    for (j, path) in enumerate(wigList):
+        if os.path.abspath(path) in factors:
+            result[j,0] = factors[os.path.abspath(path)]
+        elif len(by_name.get(os.path.basename(path), [])) == 1:
+            (match, result[j,0]) = by_name[os.path.basename(path)][0]
+            warnings.warn("Using the factor of '%s' for '%s', matched by file name." % (match, path))
+        else:
+            return None
+    return result
+
+#
+
+def stream_factors(wigList, method="nonorm", annotationPath=""):
+    """Returns the normalization factors of the datasets, reading one dataset at a time.
+
+    This gives the factors needed to normalize data read in blocks (see
+    :func:`tnseq_tools.iter_genes`) without loading all the datasets at once.
+    The factors are taken from :data:`factors_file` if it lists all the
+    datasets. Otherwise the method must compute the factors of each dataset
+    from its own read-counts (see NormMethod.per_dataset).
+
+    Arguments:
+        wigList (list): List of paths to the K datasets.
+        method (str): Name of the normalization method.
+        annotationPath (str): Path to annotation in .prot_table or GFF3 format.
+
+    Returns:
+        numpy array: (K,1) numpy array of factors, or None if the method cannot
+            be computed one dataset at a time.
+    """
+    K = len(wigList)
+    if method == "nonorm":
+        return numpy.ones((K,1))
+    M = methods.get(method)
+    if M is None or not M.scales_data:
+        return None
+    if factors_file:
+        given_factors = lookup_factors(read_factors(factors_file), wigList)
+        if given_factors is not None:
+            return given_factors
+    if not M.per_dataset:
+        return None
+
+    factors = numpy.zeros((K,1))
+    for (j, path) in enumerate(wigList):
+        (data, position) = tnseq_tools.get_data([path])
+        factors[j] = M.factors(data, [path], annotationPath, position=position)[0]
+    save_factors(wigList, method, factors)
+    return factors
+
+#
+
+def save_factors(wigList, method, factors):
+    """Writes the factors of the given datasets to :data:`save_factors_file`, if it is set.
+
+    Arguments:
+        wigList (list): List of paths to the K datasets.
+        method (str): Name of the normalization method.
+        factors (numpy array): (K,1) numpy array of factors.
+    """
+    if save_factors_file and wigList and method != "nonorm":
+        if methods.get(method, NoNorm).scales_data:
+            write_factors(save_factors_file, wigList, factors)
+        else:
+            warnings.warn("The %s method does not normalize with factors. No factors were saved." % method)
+
+#
+
+def write_factors(path, wigList, factors):
+    """Writes the factors of the given datasets to a factors file.
+
+    Factors of other datasets already in the file are kept, so the same file
+    can collect the factors of several runs (e.g. control and experimental).
+
+    Arguments:
+        path (str): Path to the factors file.
+        wigList (list): List of paths to the K datasets.
+        factors (numpy array): (K,1) numpy array of factors.
+
+    .. seealso:: :class:`read_factors`
+    """
+    all_factors = read_factors(path) if os.path.exists(path) else {}
+    for (j, wig) in enumerate(wigList):
+        all_factors[os.path.abspath(wig)] = float(numpy.ravel(factors)[j])
+    with open(path, "w") as f:
+        f.write("#Normalization factors\n")
+        for wig in sorted(all_factors):
+            f.write("%s\t%r\n" % (wig, all_factors[wig]))
 
 
 def empirical_theta(X):
@@ -663,14 +1024,70 @@ def Fzinfnb(params, args):
     return negLL
 
 
-def zinfnb_factors(data):
+def Fzinfnb_hist(params, values, counts):
+    """Objective function for the zero-inflated NB method, and its gradient.
+
+    Same negative log-likelihood as :func:`Fzinfnb`, computed over the
+    histogram of the read-counts (i.e. each distinct value once, weighted by
+    its number of sites) instead of over every site.
+
+    Arguments:
+        params (list): Parameters pi, n and p of the distribution.
+        values (numpy array): Distinct read-counts.
+        counts (numpy array): Number of sites with each of the read-counts.
+
+    Returns:
+        tuple: Negative log-likelihood, and numpy array with its gradient.
+    """
+    pi, n, p = params
+    ii_zero = values == 0
+    c0 = numpy.sum(counts[ii_zero])
+    x = values[~ii_zero]
+    c = counts[~ii_zero]
+    Cnz = numpy.sum(c)
+
+    p0 = numpy.power(p, n)
+    L0 = pi + p0
+    logpmf = scipy.special.gammaln(x+n) - scipy.special.gammaln(n) - scipy.special.gammaln(x+1) + n*numpy.log(p) + x*numpy.log(1.0-p)
+    negLL = -(c0*numpy.log(L0) + Cnz*numpy.log(1.0-pi) + numpy.sum(c*logpmf))
+
+    dpi = c0/L0 - Cnz/(1.0-pi)
+    dn = c0*p0*numpy.log(p)/L0 + numpy.sum(c*(scipy.special.digamma(x+n) - scipy.special.digamma(n) + numpy.log(p)))
+    dp = c0*n*p0/(p*L0) + numpy.sum(c*(n/p - x/(1.0-p)))
+    return (negLL, -numpy.array([dpi, dn, dp]))
+
+#
+
+def zinfnb_fit(reads):
+    """Returns the parameters of the zero-inflated NB distribution fit to the read-counts.
+
+    Arguments:
+        reads (numpy array): Read-counts at the N sites of a dataset.
+
+    Returns:
+        numpy array: Array with the parameters pi, n and p.
+    """
+    (values, counts) = numpy.unique(numpy.asarray(reads, dtype=float), return_counts=True)
+    initParams = [0.3, 10, 0.5]
+    M = "L-BFGS-B"
+    results = scipy.optimize.minimize(Fzinfnb_hist, initParams, args=(values, counts), method=M, jac=True, bounds=[(0.0001, 0.9999),(0.0001, None),(0.0001, 0.9999)])
+    return results.x
+
+#
+
+def zinfnb_factors(data, workers=None):
     """Returns the normalization factors for the data using the zero-inflated
     negative binomial method.
 
+    The distribution is fit to the histogram of the read-counts of each dataset
+    (see :func:`Fzinfnb_hist`), and the datasets are fit in parallel.
+
 
     Arguments:
         data (numpy array): (K,N) numpy array defining read-counts at N sites
             for K datasets.
+        workers (int): Number of worker processes. Defaults to the module-level
+            :data:`tnseq_tools.default_workers` setting.
 
     Returns:
         numpy array: Array with the normalization factors for the zinfnb method.
@@ -690,21 +1107,155 @@ def zinfnb_factors(data):
     .. seealso:: :class:`normalize_data`
     """
     N = len(data)
-    G = len(data[0])
+    if workers is None:
+        workers = tnseq_tools.default_workers
+
+    if workers > 1 and N > 1:
+        pool = multiprocessing.Pool(min(workers, N))
+        try:
+            params = pool.map(zinfnb_fit, [numpy.asarray(data[j]) for j in range(N)])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        params = [zinfnb_fit(data[j]) for j in range(N)]
 
     factors = numpy.zeros((N, 1))
     for j in range(N):
-        initParams = [0.3, 10, 0.5]
-        M = "L-BFGS-B"
-        Fdata = numpy.array(data[j])
-        results = scipy.optimize.minimize(Fzinfnb, initParams, args=(Fdata,), method=M, bounds=[(0.0001, 0.9999),(0.0001, None),(0.0001, 0.9999)])
-        pi, n, p = results.x
+        pi, n, p = params[j]
         mu = n*(1-p)/p
         factors[j,0] = 1.0/mu
     return numpy.array(factors)
 
 #
 
+def abgc_fraction_gof(nzdata, frac, bgsamples=200000, random_state=None):
+    """Returns the goodness of fit of the aBGC correction for the given trimming fraction.
+
+    The beta-geometric distribution is fit using the mean of the non-zero
+    read-counts trimmed by the given fraction, the read-counts are corrected
+    by mapping them through the sampled distribution, and the fit is measured
+    as the maximum chi-squared term against a geometric distribution.
+
+    Arguments:
+        nzdata (numpy array): Sorted numpy array with the non-zero read-counts of a dataset.
+        frac (float): Fraction trimmed from each end to compute the mean.
+        bgsamples (int): Integer specifying how many samples to take.
+        random_state: numpy.random.RandomState used to draw the samples.
+
+    Returns:
+        tuple: Goodness of fit (lower is better), fraction, rho and Kp.
+    """
+    S = bgsamples
+    Nnz = len(nzdata)
+    tQ = numpy.arange(0,Nnz)/float(Nnz)
+    rho = 1.0/(scipy.stats.trim_mean(nzdata, frac))
+    rho_to_fit = rho
+    A = Kp = float("nan")
+
+    try:
+        A = (numpy.sum(numpy.power(numpy.log(1.0-tQ),2)))/(numpy.sum(nzdata*numpy.log(1.0-tQ)))
+        Kp = (2.0 * numpy.exp(A) - 1)   /(numpy.exp(A) + rho - 1)
+        temp = scipy.stats.geom.rvs(scipy.stats.beta.rvs(Kp*rho, Kp*(1-rho), size=S, random_state=random_state), size=S, random_state=random_state)
+    except Exception as e:
+        print "aBGC Error:", str(e)
+        print "rho=%s\tKp=%s\tA=%s" % (rho, Kp, A)
+        temp = scipy.stats.geom.rvs(0.01, size=S, random_state=random_state)
+
+    corrected_nzdata = ecdf_geom_ppf(temp, nzdata, rho_to_fit)
+    corrected_nzmean = numpy.mean(corrected_nzdata)
+
+    Fp = scipy.stats.geom.ppf(numpy.arange(1,Nnz+1)/float(Nnz), 1.0/corrected_nzmean)
+    ii_inf = Fp == float("inf")
+    Fp[ii_inf] = max(Fp[~ii_inf]) + 100
+    ch2_indiv = numpy.power(corrected_nzdata- Fp, 2)/ Fp
+    GOF = max(ch2_indiv)
+    return (GOF, frac, rho_to_fit, Kp)
+
+#
+
+def _abgc_fraction_task(args):
+    """Evaluates one (dataset, fraction) pair of the aBGC search in a worker process."""
+    (j, nzdata, frac, bgsamples, seed) = args
+    return (j, abgc_fraction_gof(nzdata, frac, bgsamples, numpy.random.RandomState(seed)))
+
+#
+
+def _abgc_stalled(GOF_list, patience):
+    """Returns True if the last 'patience' fractions did not improve the best goodness of fit."""
+    if patience is None:
+        return False
+    GOF = [gof for (gof, frac, rho, Kp) in GOF_list]
+    return len(GOF) - 1 - int(numpy.argmin(GOF)) >= patience
+
+#
+
+def gene_read_sums(data, position, annotationPath):
+    """Returns the sum of read-counts of each gene, for each dataset.
+
+    The sums are computed on the given data with cumulative sums over the
+    sites of each gene (as in tnseq_tools.Genes with the default parameters),
+    so the datasets do not need to be read again. Genes without sites are
+    left out.
+
+    Arguments:
+        data (numpy array): (K,N) numpy array defining read-counts at N sites
+            for K datasets.
+        position (numpy array): Coordinates of the N sites.
+        annotationPath (str): Path to annotation in .prot_table or GFF3 format.
+
+    Returns:
+        numpy array: (K,G) numpy array with the read sums of the G genes with sites.
+    """
+    (K,N) = data.shape
+    if len(position) != N:
+        # Data filled with zeros at every coordinate (see get_data_zero_fill).
+        position = numpy.arange(1, N+1)
+    annotation = tnseq_tools.get_annotation(annotationPath)
+    (site_start, site_end) = tnseq_tools.get_gene_site_ranges(annotation, position)
+    ii_sites = site_end > site_start
+    cum_reads = numpy.zeros((K, N+1))
+    numpy.cumsum(data, axis=1, out=cum_reads[:,1:])
+    return cum_reads[:,site_end[ii_sites]] - cum_reads[:,site_start[ii_sites]]
+
+#
+
+def kde_peak(X, points=50000):
+    """Returns the mode of a gaussian kernel density estimate of the data.
+
+    Approximates the peak of scipy.stats.gaussian_kde (with Scott's bandwidth)
+    over a grid spanning 5 standard deviations around the mean. The data are
+    binned linearly onto the grid and convolved with the kernel using FFTs,
+    so the cost does not depend on the product of data and grid sizes.
+
+    Arguments:
+        X (numpy array): Numpy array with the data.
+        points (int): Number of points of the grid.
+
+    Returns:
+        float: Point of the grid with the highest density.
+    """
+    X = numpy.asarray(X, dtype=float)
+    mean = numpy.mean(X)
+    std = numpy.sqrt(numpy.var(X))
+    grid = numpy.linspace(mean - (5*std),  mean + (std*5), points)
+    delta = grid[1] - grid[0]
+    bandwidth = numpy.std(X, ddof=1) * len(X)**(-1.0/5)
+
+    # Linear binning of the data that fall within the grid.
+    offset = (X - grid[0])/delta
+    lower = numpy.floor(offset).astype(int)
+    ii_in = (lower >= 0) & (lower < points-1)
+    weight = offset[ii_in] - lower[ii_in]
+    counts = numpy.bincount(lower[ii_in], 1.0 - weight, minlength=points) + numpy.bincount(lower[ii_in]+1, weight, minlength=points)
+
+    width = min(int(numpy.ceil(5*bandwidth/delta)), points)
+    kernel = numpy.exp(-0.5*numpy.power(numpy.arange(-width, width+1)*delta/bandwidth, 2))
+    density = scipy.signal.fftconvolve(counts, kernel, mode="same")
+    return grid[density.argmax()]
+
+#
+
 def ecdf(S, x):
     """Calculates an empirical CDF of the given data."""
     return numpy.sum(S<=x)/float(len(S))
@@ -719,6 +1270,29 @@ def cleaninfgeom(x, rho):
 
 #
 
+def ecdf_geom_ppf(S, X, rho):
+    """Maps each value to the geometric quantile of its empirical CDF in a sample.
+
+    Equivalent to cleaninfgeom(scipy.stats.geom.ppf(ecdf(S, x), rho), rho) for
+    each x in X, but the sample is sorted once and the CDF and quantiles are
+    only computed for the unique values of X (i.e. the distinct read-counts).
+
+    Arguments:
+        S (numpy array): Sample defining the empirical CDF.
+        X (numpy array): Values to map.
+        rho (float): Parameter of the geometric distribution.
+
+    Returns:
+        numpy array: Array with the mapped value of each element of X.
+    """
+    (values, inverse) = numpy.unique(X, return_inverse=True)
+    F = numpy.searchsorted(numpy.sort(S), values, side="right")/float(len(S))
+    Q = scipy.stats.geom.ppf(F, rho)
+    Q[Q == float('inf')] = scipy.stats.geom.ppf(0.9999999999999999, rho)
+    return Q[inverse]
+
+#
+
 def norm_to_target(data, target):
     """Returns factors to normalize the data to the given target value.
 
@@ -747,5 +1321,22 @@ def norm_to_target(data, target):
     """
     (K,N) = data.shape
     factors = numpy.zeros((K,1))
-    factors[:,0] = float(target)/numpy.mean(data,1)
+    factors[:,0] = float(target)/numpy.asarray(data.mean(1)).ravel()
     return factors
+
+#
+
+def scale_rows(data, factors):
+    """Returns the data with each dataset multiplied by its normalization factor.
+
+    Arguments:
+        data (numpy array): (K,N) numpy array (or scipy.sparse matrix) defining
+            read-counts at N sites for K datasets.
+        factors (numpy array): (K,1) numpy array of normalization factors.
+
+    Returns:
+        numpy array: Array with the scaled data. Sparse data stays sparse.
+    """
+    if scipy.sparse.issparse(data):
+        return scipy.sparse.diags(numpy.ravel(factors)).dot(data).tocsr()
+    return factors * data
@@ -217,7 +217,7 @@ class qcFrame ( wx.Frame ):
             #(self.data, self.position) = tnseq_tools.get_data(self.wigList)
             self.plots_list = []
             self.statsListCtrl.DeleteAllItems()
-            (self.normdata, factors) = norm_tools.normalize_data(self.data, self.norm)
+            (self.normdata, factors) = norm_tools.normalize_data(self.data, self.norm, self.wigList)
             self.updateFiles()
             self.addPlots()
             self.statsListCtrl.Select(0)
@@ -0,0 +1,175 @@
+import numpy
+import scipy.sparse
+
+# Runs of consecutive non-insertions: 0-based index of the first and last site
+# of the run (inclusive), and number of sites in the run.
+RUN_DTYPE = numpy.dtype([("start", int), ("end", int), ("length", int)])
+
+#
+
+def insertion_sites(data):
+    """Returns the (sorted) indexes of the sites with insertions, and the number of sites.
+
+    Arguments:
+        data (list): List of numeric data, or (K,N) numpy array or scipy.sparse
+            matrix. Sites count as insertions if the sum over the K datasets is
+            > 0 (for sparse matrices, if any of the datasets is > 0).
+
+    Returns:
+        tuple: Numpy array with the indexes of the sites with insertions, and
+            the number of sites N.
+    """
+    if scipy.sparse.issparse(data):
+        data = data.tocsr()
+        return (numpy.unique(data.indices[data.data > 0]), data.shape[1])
+    data = numpy.asarray(data)
+    if data.ndim > 1:
+        data = numpy.sum(data, 0)
+    return (numpy.flatnonzero(data > 0), len(data))
+
+#
+
+def zero_runs(data):
+    """Returns the runs of consecutive non-insertions as a structured array.
+
+    The runs are found from the gaps between consecutive insertions, so the
+    cost for sparse data depends on the number of insertions only.
+
+    Arguments:
+        data (list): List of numeric data (see :func:`insertion_sites`).
+
+    Returns:
+        narray: Numpy array of RUN_DTYPE with the start, end and length of each run.
+
+    :Example:
+
+        >>> import pytransit.rle_tools as rle_tools
+        >>> print rle_tools.zero_runs([0, 0, 3, 0, 1, 0, 0, 0])
+        [(0, 1, 2) (3, 3, 1) (5, 7, 3)]
+    """
+    (index, N) = insertion_sites(data)
+    starts = numpy.concatenate(([0], index + 1))
+    ends = numpy.concatenate((index, [N])) - 1
+    ii_run = ends >= starts
+    result = numpy.zeros(numpy.sum(ii_run), dtype=RUN_DTYPE)
+    result["start"] = starts[ii_run]
+    result["end"] = ends[ii_run]
+    result["length"] = ends[ii_run] - starts[ii_run] + 1
+    return result
+
+#
+
+def runs(data):
+    """Return list of all the runs of consecutive non-insertions.
+
+    Arguments:
+        data (list): List of numeric data (see :func:`insertion_sites`).
+
+    Returns:
+        list: List of the length of the runs of non-insertions. Non-zero sites are treated as runs of zero.
+    """
+    (index, N) = insertion_sites(data)
+    if len(index) == 0:
+        return [N] if N else [0]
+    gaps = numpy.diff(numpy.concatenate(([-1], index))) - 1
+    result = numpy.column_stack((gaps, numpy.zeros(len(gaps), dtype=int))).ravel()
+    keep = numpy.ones(len(result), dtype=bool)
+    keep[0::2] = gaps > 0
+    result = result[keep].tolist()
+    if N - 1 - index[-1] > 0:
+        result.append(int(N - 1 - index[-1]))
+    return result
+
+#
+
+def runindex(runs):
+    """Returns a list of the indexes of the start of the runs; complements runs().
+
+    Arguments:
+        runs (list): List of the length of the runs, as returned by runs().
+
+    Returns:
+        list: List of the index of the runs of non-insertions. Non-zero sites are treated as runs of zero.
+    """
+    width = numpy.maximum(numpy.asarray(runs, dtype=int), 1)
+    return (numpy.cumsum(width) - width).tolist()
+
+#
+
+def maxrun(lst, item=0):
+    """Returns the length of the maximum run an item in a given list.
+
+    Arguments:
+        lst (list): List of numeric items.
+        item (float): Number to look for consecutive runs of.
+
+    Returns:
+        int: Length of the maximum run of consecutive instances of item.
+    """
+    is_item = numpy.concatenate(([0], numpy.asarray(lst) == item, [0])).astype(int)
+    edges = numpy.flatnonzero(numpy.diff(is_item))
+    if len(edges) == 0:
+        return 0
+    return int(numpy.max(edges[1::2] - edges[0::2]))
+
+#
+
+def runs_w_info(data):
+    """Return list of all the runs of consecutive non-insertions with the start and end locations.
+
+    Arguments:
+        data (list): List of numeric data (see :func:`insertion_sites`).
+
+    Returns:
+        list: List of dictionary from run to length and position information
+            of the run. Start and end are 1-based coordinates.
+    """
+    result = zero_runs(data)
+    return [dict(length = int(length), start = int(start) + 1, end = int(end) + 1) for (start, end, length) in result]
+
+#
+
+def segment_max_runs(tosses, site_start, site_end):
+    """Returns the maximum run of non-insertions within each segment of sites.
+
+    Segments (e.g. genes) may overlap. The sites of all the segments are laid
+    out one after the other, the run of non-insertions ending at each site is
+    measured with a running maximum of the last insertion, and the segments
+    are reduced with numpy.maximum.reduceat.
+
+    Arguments:
+        tosses (list): List of sites represented as bernoulli trials (1 = insertion).
+        site_start (list): List with the index of the first site of each segment.
+        site_end (list): List with the index one past the last site of each segment.
+
+    Returns:
+        tuple: Two numpy arrays with the length of the maximum run of each
+            segment, and the index of the last site of the last maximum run
+            (-1 if the segment has no run of non-insertions).
+    """
+    tosses = numpy.asarray(tosses)
+    site_start = numpy.asarray(site_start, dtype=int)
+    site_end = numpy.asarray(site_end, dtype=int)
+    G = len(site_start)
+    n = site_end - site_start
+
+    offsets = numpy.concatenate(([0], numpy.cumsum(n)))
+    local = numpy.arange(offsets[-1])
+    segment_first = numpy.repeat(offsets[:-1], n)
+    sites = local - segment_first + numpy.repeat(site_start, n)
+    last_insertion = numpy.where(tosses[sites] > 0, local, -1)
+    if len(local):
+        last_insertion = numpy.maximum.accumulate(last_insertion)
+    run_length = local - numpy.maximum(last_insertion, segment_first - 1)
+
+    max_run = numpy.zeros(G, dtype=int)
+    run_end = numpy.zeros(G, dtype=int) - 1
+    nonempty = n > 0
+    if numpy.any(nonempty):
+        max_run[nonempty] = numpy.maximum.reduceat(run_length, offsets[:-1][nonempty])
+        segment_max = numpy.repeat(max_run, n)
+        is_max_run = (run_length == segment_max) & (segment_max > 0)
+        run_end[nonempty] = numpy.maximum.reduceat(numpy.where(is_max_run, local, -1), offsets[:-1][nonempty])
+    has_run = run_end >= 0
+    run_end[has_run] = sites[run_end[has_run]]
+    return (max_run, run_end)
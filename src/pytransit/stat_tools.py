@@ -2,6 +2,10 @@ import math
 import numpy
 import scipy.stats
 
+# Multiple testing correction used by BH_fdr_correction in the analysis methods
+# ("BH", "Storey" or "Bonferroni"). Set from the console with "--fdr <method>".
+default_fdr_method = "BH"
+
 def transformToRange(X, new_min, new_max, old_min=None, old_max=None):
 
     if old_min == None:
@@ -256,24 +260,46 @@ def phi_coefficient(X,Y):
     phi_coeff = (x1y1*x0y0 - x1y0*x0y1)/math.sqrt(x1*x0*y1*y0)
     return phi_coeff
 
-def BH_fdr_correction(X):
-    """Adjusts p-values using the Benjamini Hochberg procedure"""
-    n = len(X)
-    qvalues = numpy.zeros(n)
-    pvalues = numpy.array(X)
-    pvalues.sort()
-    pvalues = pvalues[::-1]
-    
-    for i in xrange(n):
-        rank = n - i
-        qvalues[i] = n/float(rank) * pvalues[i]
- 
-    for i in xrange(0, n-1):
-        if qvalues[i] < qvalues[i+1]:
-            qvalues[i+1] = qvalues[i]
-        
-    p2qval = dict([(p,q) for (p,q) in zip(pvalues,qvalues)])
-    return numpy.array([p2qval[p] for p in X])
+def BH_fdr_correction(X, method=None, lam=0.5):
+    """Adjusts p-values using the Benjamini Hochberg procedure (or the given method, see fdr_correction)"""
+    if method is None:
+        method = default_fdr_method
+    return fdr_correction(X, method=method, lam=lam)
+
+def fdr_correction(X, method="BH", lam=0.5):
+    """Adjusts p-values for multiple testing, returning them in the input order.
+
+    Arguments:
+        X (list): List of p-values.
+        method (str): "BH" for the Benjamini Hochberg procedure, "Storey" for
+            Storey's q-values (BH scaled by the estimated fraction of true null
+            hypotheses) or "Bonferroni".
+        lam (float): Threshold used to estimate the fraction of true null
+            hypotheses from the p-values above it (Storey only), as
+            (1 + #{p > lam})/(n*(1 - lam)), at most 1.
+
+    Returns:
+        numpy array: Array with the adjusted p-values.
+    """
+    pvalues = numpy.asarray(X, dtype=float)
+    n = len(pvalues)
+    if n == 0:
+        return numpy.zeros(0)
+    if method == "Bonferroni":
+        return numpy.minimum(pvalues * n, 1.0)
+    if method not in ("BH", "Storey"):
+        raise ValueError("Unknown multiple testing correction method '%s'." % method)
+
+    order = numpy.argsort(pvalues)[::-1]
+    rank = numpy.arange(n, 0, -1)
+    qvalues = numpy.minimum.accumulate(n/rank.astype(float) * pvalues[order])
+    if method == "Storey":
+        # The added count keeps the estimate conservative when few p-values exceed lam.
+        pi0 = min((1.0 + numpy.sum(pvalues > lam))/(n * (1.0 - lam)), 1.0)
+        qvalues *= pi0
+    result = numpy.zeros(n)
+    result[order] = qvalues
+    return result
 
 def bayesian_ess_thresholds(Z_raw, ALPHA=0.05):
     """Returns Essentiality Thresholds using a BH-like procedure"""
@@ -281,85 +307,120 @@ def bayesian_ess_thresholds(Z_raw, ALPHA=0.05):
     W = 1 - Z
     N = len(Z)
 
+    # Essential threshold: first i (from 3) where the weight w_i exceeds the
+    # mean of the first i-2 weights by more than ALPHA*i/N.
     ess_threshold = 1.00
-    INDEX = range(3, N+1)
-    count = 0
-    for i in INDEX:
-        count +=1
-        wi = 1 - Z[i-1]
-        ai_n = (ALPHA*i)/N
-        mean_wi = numpy.average(W[0:i-2])
-        delta_w = wi - mean_wi
-        #if count < 30: print i, wi, ai_n, delta_w
-        if delta_w > ai_n:
-            ess_threshold = Z[i-1]
-            #print "i", i
-            break
-
+    INDEX = numpy.arange(3, N+1)
+    cum_W = numpy.concatenate(([0.0], numpy.cumsum(W)))
+    delta_w = W[INDEX-1] - cum_W[INDEX-2]/(INDEX-2)
+    ii_ess = numpy.flatnonzero(delta_w > (ALPHA*INDEX)/N)
+    if len(ii_ess) > 0:
+        ess_threshold = Z[INDEX[ii_ess[0]]-1]
+
+    # Non-essential threshold: going down from i = N, the last Z[N-i] before
+    # ALPHA*i/N exceeds the difference between Z[N-i+1] and the mean of Z[N-i+1:].
     noness_threshold = 0.00
-    count = 0
-    INDEX = range(0, N+1)
-    INDEX.sort(reverse=True)
-    for i in INDEX:
-        wi = Z[N-i+1]
-        ai_n = (ALPHA*i)/N
-        mean_wi = numpy.average(Z[N-i+1:])
-        delta_w = Z[N-i+1] - mean_wi
-        count +=1
-        #print count
-        #if count < 20:
-        #   print i, wi, ai_n, mean_wi, delta_w, N-i+1, N-1, W[N-i-1], W[i-1]
-
-        if ai_n > delta_w:
-        #   print i, wi, ai_n, mean_wi, delta_w, N-i+1, N-1, W[N-i-1], W[i-1]
-            break
-        noness_threshold = Z[N-i]
+    INDEX = numpy.arange(N, 1, -1)
+    first = N - INDEX + 1
+    suffix_Z = numpy.cumsum(Z[::-1])[::-1]
+    delta_w = Z[first] - suffix_Z[first]/(N - first)
+    ii_stop = numpy.flatnonzero((ALPHA*INDEX)/N > delta_w)
+    last = ii_stop[0] if len(ii_stop) > 0 else len(INDEX)
+    if last > 0:
+        noness_threshold = Z[N-INDEX[last-1]]
 
     return(ess_threshold, noness_threshold)
 
 
 def tricube(X):
-    #TODO: Write docstring
+    """Returns the tricube kernel, (1-|x|^3)^3 within [-1, 1] and 0 elsewhere."""
     result = numpy.zeros(len(X))
     ii = numpy.logical_and(X >= -1, X <= 1)
     result[ii] = numpy.power(1 - numpy.power(numpy.abs(X[ii]), 3), 3)
     return result
 
 
-def loess(X, Y, h=10000):
-    #TODO: Write docstring
-    smoothed = numpy.zeros(len(Y))
-    for i,x in enumerate(X):
-        W = tricube((X-x)/float(h))
-        sW = numpy.sum(W)
-        wsX = numpy.sum(W*X)
-        wsY = numpy.sum(W*Y)
-        wsXY = numpy.sum(W*X*Y)
-        sXX = numpy.sum(X*X)
+def loess(X, Y, h=10000, block=1000000):
+    """Returns the LOESS smoothing of Y, using tricube weights with bandwidth h.
+
+    Only the points within the bandwidth of each x contribute to its fit, so
+    X is sorted once and the weighted sums of each point are accumulated over
+    its window of neighbours. The windows of consecutive points are processed
+    together, in blocks of at most about 'block' (point, neighbour) pairs.
+
+    Arguments:
+        X (list): List of coordinates.
+        Y (list): List of values at each coordinate.
+        h (float): Bandwidth of the tricube kernel.
+        block (int): Approximate number of (point, neighbour) pairs processed at once.
+
+    Returns:
+        numpy array: Array with the smoothed value at each coordinate.
+    """
+    X = numpy.asarray(X, dtype=float)
+    Y = numpy.asarray(Y, dtype=float)
+    N = len(X)
+    smoothed = numpy.zeros(N)
+    if N == 0:
+        return smoothed
+    order = numpy.argsort(X, kind="mergesort")
+    sorted_X = X[order]
+    sorted_Y = Y[order]
+    sXX = numpy.sum(X*X)
+
+    lower = numpy.searchsorted(sorted_X, X - h, side="left")
+    upper = numpy.searchsorted(sorted_X, X + h, side="right")
+    width = upper - lower
+    cum_width = numpy.concatenate(([0], numpy.cumsum(width)))
+    start = 0
+    while start < N:
+        end = max(numpy.searchsorted(cum_width, cum_width[start] + block, side="right") - 1, start + 1)
+        end = min(end, N)
+        n_pairs = cum_width[end] - cum_width[start]
+        point = numpy.repeat(numpy.arange(start, end), width[start:end])
+        neighbour = numpy.arange(n_pairs) - numpy.repeat(cum_width[start:end] - cum_width[start], width[start:end]) + numpy.repeat(lower[start:end], width[start:end])
+        nX = sorted_X[neighbour]
+        nY = sorted_Y[neighbour]
+        W = tricube((nX - X[point])/float(h))
+        local = point - start
+        sW = numpy.bincount(local, W, minlength=end-start)
+        wsX = numpy.bincount(local, W*nX, minlength=end-start)
+        wsY = numpy.bincount(local, W*nY, minlength=end-start)
+        wsXY = numpy.bincount(local, W*nX*nY, minlength=end-start)
         B = (sW * wsXY - wsX * wsY)/(sW * sXX - numpy.power(wsX,2))
         A = (wsY - B*wsX) / sW
-        smoothed[i] = B*x + A
+        smoothed[start:end] = B*X[start:end] + A
+        start = end
     return smoothed
 
 
 def loess_correction(X, Y, h=10000, window=100):
-    #TODO: Write docstring
+    """Returns the values corrected for positional bias using LOESS.
+
+    The values are summed in windows of consecutive sites, the window sums are
+    smoothed with :func:`loess`, and each value is scaled by the smoothed sum
+    of its window relative to the mean window sum.
+
+    Arguments:
+        X (list): List of coordinates of the sites.
+        Y (list): List of values (e.g. read-counts) at each site.
+        h (float): Bandwidth of the LOESS smoothing, in window coordinates.
+        window (int): Number of sites in each window.
+
+    Returns:
+        numpy array: Array with the corrected values.
+    """
     Y = numpy.array(Y)
     size = len(X)/window + 1
-    x_w = numpy.zeros(size)
-    y_w = numpy.zeros(size)
-    for i in range(len(X)/window + 1):
-        x_w[i] = window*i
-        y_w[i] = sum(Y[window*i:window*(i+1)])
+    x_w = window*numpy.arange(size, dtype=float)
+    padded_Y = numpy.zeros(size*window)
+    padded_Y[:len(Y)] = Y
+    y_w = padded_Y.reshape((size, window)).sum(1)
 
     ysmooth = loess(x_w, y_w, h)
     mline = numpy.mean(y_w)
-    y_w * (ysmooth/mline)
-
-    normalized_Y = numpy.zeros(len(Y))
-    for i in range(size):
-        normalized_Y[window*i:window*(i+1)] = Y[window*i:window*(i+1)] * (ysmooth[i]/mline)
 
+    normalized_Y = Y * numpy.repeat(ysmooth/mline, window)[:len(Y)]
     return normalized_Y
 
 
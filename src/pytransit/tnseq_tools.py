@@ -1,11 +1,34 @@
 import sys
 import os
 import math
+import io
+import re
+import bz2
+import copy
+import glob
+import gzip
+import hashlib
+import tempfile
 import warnings
+import multiprocessing
+import multiprocessing.sharedctypes
 import numpy
 import scipy.stats
+import scipy.sparse
+import itertools
 from functools import total_ordering
 
+try:
+    import lzma
+    hasLzma = True
+except ImportError:
+    try:
+        from backports import lzma
+        hasLzma = True
+    except ImportError:
+        hasLzma = False
+
+import rle_tools
 
 try:
     import norm_tools
@@ -14,8 +37,49 @@ except ImportError:
     noNorm = True
     warnings.warn("Problem importing the norm_tools.py module. Read-counts will not be normalized. Some functions may not work.")
 
+
+# Parsed .wig files are cached as binary .npy arrays in this directory, so
+# that repeated loads of the same dataset can skip the text parsing. The cache
+# is turned off by setting the TRANSIT_NO_CACHE environment variable (or from
+# the console with "--no-cache"), and the least recently used files are removed
+# once it grows beyond cache_max_size bytes (see prune_cache), except for the
+# files of the datasets being loaded. It is safe to delete the directory at any
+# time.
+use_cache = not os.environ.get("TRANSIT_NO_CACHE")
+cache_dir = os.environ.get("TRANSIT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".transit", "cache"))
+cache_max_size = int(float(os.environ.get("TRANSIT_CACHE_SIZE", 2048)) * 2**20)
+
+# Default number of worker processes used for parallel work (e.g. parsing the
+# wig files in get_data). Set from the console with "--workers <N>".
+default_workers = 1
+
+# Whether read-counts are held in compact form by default: raw counts as uint32
+# and normalized counts as float32. Set from the console with "--compact".
+default_compact = False
+COMPACT_COUNT_DTYPE = numpy.uint32
+COMPACT_NORM_DTYPE = numpy.float32
+
+# Whether Genes objects built from wig files are cached by default as .npz
+# files in cache_dir (normalized read-counts, gene-to-site mapping and gene
+# statistics). Set from the console with "--cache-genes".
+use_genes_cache = False
+
+# Whether the methods that are local to each gene (griffin and resampling) read
+# the datasets in blocks of sites by default, instead of loading them at once
+# (see iter_genes). Set from the console with "--stream".
+default_stream = False
+
+# Size of the blocks read from (compressed) wig files.
+WIG_BUFFER_SIZE = 1024*1024
+
+# Parsed annotations, keyed by (path, size, modification time, format); see get_annotation.
+_annotation_cache = {}
+
+WIG_DATA_LINE = re.compile(r"^[0-9]", re.MULTILINE)
+WIG_OTHER_LINE = re.compile(r"^[^0-9\n].*\n?", re.MULTILINE)
+
 @total_ordering
-class Gene:
+class Gene(object):
     """Class defining a gene with useful attributes for TnSeq analysis.
 
     This class helps define a "gene" with attributes that facilitate TnSeq
@@ -23,11 +87,16 @@ class Gene:
     class (with an s) can be used to define list of Gene objects with more
     useful operations on the "genome" level.
 
+    The reads and positions are kept as views of the given arrays (e.g. of
+    the matrix of a Genes object) rather than copies, and the statistics
+    (tosses, runs, k, r, s and t) are only computed when first accessed.
+
     Attributes:
         orf: A string defining the ID of the gene.
         name: A string with the human readable name of the gene.
         desc: A string with the description of the gene.
         reads: List of lists of read-counts in possible site replicate dataset.
+            Sparse (scipy.sparse) read-counts are kept sparse.
         position: List of coordinates of the possible sites.
         start: An integer defining the start coordinate for the gene.
         end: An integer defining the end coordinate for the gene.
@@ -48,6 +117,9 @@ class Gene:
         .. seealso:: :class:`Genes`
         """
 
+    __slots__ = ("orf", "name", "desc", "reads", "position", "start", "end", "strand",
+        "_tosses", "_runs", "_k", "_r", "_s", "_t")
+
     def __init__(self, orf, name, desc, reads, position, start=0, end=0, strand=""):
         """Initializes the Gene object.
 
@@ -72,26 +144,78 @@ class Gene:
         self.start = start
         self.end = end
         self.strand = strand
-        self.reads = numpy.array(reads)
-        self.position = numpy.array(position, dtype=int)
-        self.tosses = tossify(self.reads)
-        try:
-            self.runs = runs(self.tosses)
-        except Exception as e:
-            print orf, name, self.tosses
-            raise e
+        if scipy.sparse.issparse(reads):
+            self.reads = reads.tocsr()
+        else:
+            self.reads = numpy.asarray(reads)
+        self.position = numpy.asarray(position, dtype=int)
+        self._tosses = None
+        self._runs = None
+        self._k = None
+        self._r = None
+        self._s = None
+        self._t = None
 
-        self.k = int(numpy.sum(self.tosses))
-        self.n = len(self.tosses)
-        try:
-            self.r = numpy.max(self.runs)
-        except Exception as e:
-            print orf, name, self.tosses
-            print self.runs
-            raise e
+#
+
+    @property
+    def tosses(self):
+        """Sites represented as bernoulli trials, with insertions as 1 (computed on first access)."""
+        if self._tosses is None:
+            self._tosses = tossify(self.reads)
+        return self._tosses
+
+#
+
+    @property
+    def runs(self):
+        """List of the runs of non-insertions of the gene (computed on first access)."""
+        if self._runs is None:
+            self._runs = runs(self.tosses)
+        return self._runs
+
+#
+
+    @property
+    def k(self):
+        """Number of sites with insertions (computed on first access)."""
+        if self._k is None:
+            self._k = int(numpy.sum(self.tosses))
+        return self._k
+
+#
+
+    @property
+    def n(self):
+        """Number of sites of the gene."""
+        return self.reads.shape[1]
+
+#
 
-        self.s = self.get_gap_span()
-        self.t = self.get_gene_span()
+    @property
+    def r(self):
+        """Maximum run of non-insertions (computed on first access)."""
+        if self._r is None:
+            self._r = numpy.max(self.runs)
+        return self._r
+
+#
+
+    @property
+    def s(self):
+        """Span of nucleotides of the maximum run of non-insertions (computed on first access)."""
+        if self._s is None:
+            self._s = self.get_gap_span()
+        return self._s
+
+#
+
+    @property
+    def t(self):
+        """Span of nucleotides of the sites of the gene (computed on first access)."""
+        if self._t is None:
+            self._t = self.get_gene_span()
+        return self._t
 
 #
 
@@ -199,7 +323,7 @@ class Gene:
         Returns:        
             float: Total sum of read-counts.
         """
-        return numpy.sum(self.reads, 1)
+        return numpy.asarray(self.reads.sum(1)).ravel()
 
 #
 
@@ -223,6 +347,8 @@ class Genes:
         include_nc: Boolean determining whether to include non-coding areas.
         orf2index: Dictionary of orf id to index in the genes list.
         genes: List of the Gene objects.
+        site_start: Numpy array with the index of the first site of each gene.
+        site_end: Numpy array with the index one past the last site of each gene.
 
 
     :Example:
@@ -307,7 +433,7 @@ class Genes:
 
 #
     
-    def __init__(self, wigList, annotation, norm="nonorm", reps="All", minread=1, ignoreCodon = True, nterm=0.0, cterm=0.0, include_nc = False, data=[], position=[]):
+    def __init__(self, wigList, annotation, norm="nonorm", reps="All", minread=1, ignoreCodon = True, nterm=0.0, cterm=0.0, include_nc = False, data=[], position=[], compact=None, cache=None):
         """Initializes the gene list based on the list of wig files and a prot_table.
 
         This class helps define a list of Gene objects with attributes that 
@@ -324,8 +450,16 @@ class Genes:
             nterm (float): Float number of the fraction of the N-terminus to ignore.
             cterm (float): Float number of the fraction of the C-terminus to ignore.
             include_nc (bool): Boolean determining whether to include non-coding areas.
-            data (list): List of data. Used to define the object without files. 
+            data (list): List of data. Used to define the object without files. May be
+                a scipy.sparse matrix (e.g. from get_data_zero_fill(sparse=True)),
+                in which case the read-counts of each gene are kept sparse.
             position (list): List of position of sites. Used to define the object without files.
+            compact (bool): Boolean specifying whether to load the wig files in compact
+                form (see :func:`get_data`). Normalized read-counts are then float32.
+            cache (bool): Boolean specifying whether to store (and reuse) the constructed
+                object in the cache directory (see :func:`genes_cache_key`). Only used
+                when the object is built from the wig files. Defaults to the module-level
+                :data:`use_genes_cache` setting.
 
 
         """
@@ -339,78 +473,108 @@ class Genes:
         self.cterm = cterm
         self.include_nc = include_nc
 
-        isProt = True
-        filename, file_extension = os.path.splitext(self.annotation)
-        if file_extension.lower() in [".gff", ".gff3"]:
-            isProt = False
-
         self.orf2index = {}
         self.genes = []
         
-        orf2info = get_gene_info(self.annotation)
-        if not numpy.any(data):
-            (data, position) = get_data(self.wigList)
-            ii_min = data < self.minread
-            data[ii_min] = 0
-        hash = get_pos_hash(self.annotation)
-
-        if not noNorm:
-            (data, factors) = norm_tools.normalize_data(data, norm, self.wigList, self.annotation)
+        annotation_obj = get_annotation(self.annotation)
+        orf2info = annotation_obj.gene_info()
+        self._table = None
+        from_files = not scipy.sparse.issparse(data) and not numpy.any(data)
+        if cache is None:
+            cache = use_genes_cache
+        if compact is None:
+            compact = default_compact
+        cache_path = None
+        cached = None
+        if from_files and cache:
+            key = genes_cache_key(self.wigList, self.annotation, norm, reps, minread, ignoreCodon, nterm, cterm, compact)
+            cache_path = os.path.join(cache_dir, key + "_genes.npz")
+            cached = _load_genes_cache(cache_path)
+
+        if cached is not None:
+            (data, position, self.site_start, self.site_end, self._table, factors) = cached
+            if not noNorm:
+                norm_tools.save_factors(self.wigList, norm, factors)
         else:
-            factors = []
-       
-        if reps.lower() != "all":
-            data = numpy.array([combine_replicates(data, method=reps)])
+            if from_files:
+                (data, position) = get_data(self.wigList, compact=compact)
+                ii_min = data < self.minread
+                data[ii_min] = 0
+
+            if not noNorm:
+                (data, factors) = norm_tools.normalize_data(data, norm, self.wigList, self.annotation, position)
+            else:
+                factors = []
+           
+            if reps.lower() != "all":
+                data = combine_replicates(data, method=reps)
+                if not scipy.sparse.issparse(data):
+                    data = numpy.array([data])
+
+            position = numpy.asarray(position, dtype=int)
+            (self.site_start, self.site_end) = get_gene_site_ranges(annotation_obj, position, self.ignoreCodon, self.nterm, self.cterm)
 
         K,N = data.shape
        
         self.data = data 
-        orf2posindex = {}
-        visited_list = []
-        for i in range(N):
-            genes_with_coord = hash.get(position[i], [])
-            for gene in genes_with_coord:
-                if gene not in orf2posindex: visited_list.append(gene)
-                if gene not in orf2posindex: orf2posindex[gene] = []
+        self.position = position
+        if cache_path is not None and cached is None:
+            _save_genes_cache(cache_path, data, position, self.table(), factors)
+        for (count, gene) in enumerate(annotation_obj.orf):
+            name,desc,start,end,strand = orf2info.get(gene, ["", "", 0, 0, "+"])
+            pos_start = self.site_start[count]
+            pos_end = self.site_end[count]
+            if pos_end > pos_start:
+                self.genes.append(Gene(gene, name, desc, data[:, pos_start:pos_end], position[pos_start:pos_end], start, end, strand))
+            else:
+                self.genes.append(Gene(gene, name, desc, numpy.array([[]]), numpy.array([]), start, end, strand))
+            self.orf2index[gene] = count
 
-                name,desc,start,end,strand = orf2info.get(gene, ["", "", 0, 0, "+"])
-                
-                if strand == "+":
-                    if self.ignoreCodon and position[i] > end - 3:
-                        continue
-                else:
-                    if self.ignoreCodon and position[i] < start + 3:
-                        continue
+#
 
-                if (position[i]-start)/float(end-start) < (self.nterm/100.0):
-                    continue
-                
-                if (position[i]-start)/float(end-start) > ((100-self.cterm)/100.0):
-                    continue
+    def select(self, rows):
+        """Returns a Genes object over a subset of the datasets, reusing the site-to-gene mapping.
 
-                orf2posindex[gene].append(i)
+        This lets methods that compare conditions (e.g. control and experimental
+        datasets) map the sites to the genes only once, and then work on the
+        read-counts of each condition separately.
 
-        count = 0
-        for line in open(self.annotation):
-            if line.startswith("#"): continue
-            tmp = line.split("\t")
-        
-            if isProt:
-                gene = tmp[8].strip()
-                name,desc,start,end,strand = orf2info.get(gene, ["", "", 0, 0, "+"])
-            else:
-                features = dict([tuple(f.split("=",1)) for f in filter(lambda x: "=" in x, tmp[8].split(";"))])
-                gene = features["ID"]
-                name,desc,start,end,strand = orf2info.get(gene, ["", "", 0, 0, "+"])
-            posindex = orf2posindex.get(gene, [])
-            if posindex:
-                pos_start = orf2posindex[gene][0]
-                pos_end = orf2posindex[gene][-1]
-                self.genes.append(Gene(gene, name, desc, data[:, pos_start:pos_end+1], position[pos_start:pos_end+1], start, end, strand))
+        Arguments:
+            rows: Index of the desired datasets, i.e. rows of the data (e.g. a
+                slice, which gives views of the data, or a list of integers).
+
+        Returns:
+            Genes: Object with the same genes, holding only the selected datasets.
+
+        :Example:
+
+            >>> G = tnseq_tools.Genes([], "transit/genomes/H37Rv.prot_table", data=data, position=position)
+            >>> Gctrl = G.select(slice(0, 2))
+            >>> Gexp = G.select(slice(2, None))
+        """
+        selected = copy.copy(self)
+        selected.data = self.data[rows]
+        selected._table = None
+        selected.genes = []
+        for (i, gene) in enumerate(self.genes):
+            if self.site_end[i] > self.site_start[i]:
+                reads = selected.data[:, self.site_start[i]:self.site_end[i]]
             else:
-                self.genes.append(Gene(gene, name, desc, numpy.array([[]]), numpy.array([]), start, end, strand))
-            self.orf2index[gene] = count
-            count += 1
+                reads = numpy.array([[]])
+            selected.genes.append(Gene(gene.orf, gene.name, gene.desc, reads, gene.position, gene.start, gene.end, gene.strand))
+        return selected
+
+#
+
+    def table(self):
+        """Returns the statistics of all the genes as columns (computed once).
+
+        Returns:
+            GeneTable: Object with numpy arrays of k, n, r, s, t, theta and phi.
+        """
+        if self._table is None:
+            self._table = GeneTable(self.data, self.position, self.site_start, self.site_end)
+        return self._table
 
 #
 
@@ -420,11 +584,7 @@ class Genes:
         Returns:
             narray: Numpy array with the number of insertions for all genes.
         """
-        G = len(self.genes)
-        K = numpy.zeros(G)
-        for i in xrange(G):
-            K[i] = self.genes[i].k
-        return K
+        return self.table().k.astype(float)
 
 #
 
@@ -434,11 +594,7 @@ class Genes:
         Returns:
             narray: Numpy array with the number of sites for all genes.
         """
-        G = len(self.genes)
-        N = numpy.zeros(G)
-        for i in range(G):
-            N[i] = self.genes[i].n
-        return N
+        return self.table().n.astype(float)
 
 #
 
@@ -448,11 +604,7 @@ class Genes:
         Returns:
             narray: Numpy array with the max run of non-insertions for all genes.
         """
-        G = len(self.genes)
-        R = numpy.zeros(G)
-        for i in xrange(G):
-            R[i] = self.genes[i].r
-        return R 
+        return self.table().r.astype(float)
 
 #
 
@@ -463,11 +615,7 @@ class Genes:
         Returns:
             narray: Numpy array with the span of gap for all genes.
         """
-        G = len(self.genes)
-        S = numpy.zeros(G)
-        for i in xrange(G):
-            S[i] = self.genes[i].s
-        return S
+        return self.table().s.astype(float)
 
 #
   
@@ -478,11 +626,7 @@ class Genes:
         Returns:
             narray: Numpy array with the span of gene for all genes.
         """
-        G = len(self.genes)
-        T = numpy.zeros(G)
-        for i in xrange(G):
-            T[i] = self.genes[i].t
-        return T
+        return self.table().t.astype(float)
 
 #
 
@@ -506,11 +650,7 @@ class Genes:
         Returns:
             narray: Numpy array with the density for all genes.
         """
-        G = len(self.genes)
-        theta = numpy.zeros(G)
-        for i in xrange(G):
-            theta[i] = self.genes[i].theta()
-        return theta
+        return self.table().theta.copy()
 
 #
 
@@ -520,7 +660,7 @@ class Genes:
         Returns:
             narray: Numpy array with the complement of density for all genes.
         """
-        return 1.0 - self.theta()
+        return self.table().phi.copy()
 
 #
 
@@ -530,11 +670,7 @@ class Genes:
         Returns:
             float: Total sum of reads across all genes.
         """
-        G = len(self.genes)
-        total = 0
-        for i in xrange(G):
-            total += self.genes[i].k
-        return total
+        return int(numpy.sum(self.table().k))
 
 #
 
@@ -544,11 +680,7 @@ class Genes:
         Returns:
             int: Total number of sites across all genes.
         """
-        G = len(self.genes)
-        total = 0
-        for i in xrange(G):
-            total += self.genes[i].n
-        return total
+        return int(numpy.sum(self.table().n))
 
 #
 
@@ -618,17 +750,421 @@ class Genes:
 
 #
 
+class GeneTable:
+    """Class defining the statistics of a list of genes as columns of numpy arrays.
+
+    The statistics of the Gene objects (k, n, r, s, t, theta and phi) are
+    computed for all the genes at once, with segmented reductions over the
+    vector of sites, instead of gene by gene. Genes that share sites (i.e.
+    overlapping genes) are handled like separate Gene objects.
+
+    Attributes:
+        site_start: Numpy array with the index of the first site of each gene.
+        site_end: Numpy array with the index one past the last site of each gene.
+        k: Numpy array with the number of sites with insertions in each gene.
+        n: Numpy array with the number of sites in each gene.
+        r: Numpy array with the maximum run of non-insertions in each gene.
+        s: Numpy array with the span of nucleotides of the maximum run of each gene.
+        t: Numpy array with the span of nucleotides of the sites of each gene.
+        theta: Numpy array with the insertion density of each gene.
+        phi: Numpy array with the non-insertion density of each gene.
+        k_reps: Numpy array with the number of insertions summed over replicates.
+
+
+    :Example:
+
+        >>> import pytransit.tnseq_tools as tnseq_tools
+        >>> G = tnseq_tools.Genes(["transit/data/glycerol_H37Rv_rep1.wig", "transit/data/glycerol_H37Rv_rep2.wig"], "transit/genomes/H37Rv.prot_table")
+        >>> table = G.table()
+        >>> print table.k[0], table.n[0], table.r[0]
+        0 31 31
+
+        .. seealso:: :class:`Genes` :class:`Gene`
+        """
+
+    # Names of the per-gene columns (besides site_start and site_end).
+    COLUMNS = ("n", "k", "k_reps", "r", "s", "t", "theta", "phi")
+
+#
+
+    def __init__(self, data, position, site_start, site_end, columns=None):
+        """Computes the statistics of all the genes.
+
+        Arguments:
+            data (numpy array): (K,N) numpy array (or scipy.sparse matrix) of read-counts.
+            position (list): List of coordinates of the N sites.
+            site_start (list): List with the index of the first site of each gene.
+            site_end (list): List with the index one past the last site of each gene.
+            columns (dict): Dictionary of previously computed columns (see
+                :data:`GeneTable.COLUMNS`), e.g. from the Genes cache. If given,
+                the statistics are not computed again.
+        """
+        position = numpy.asarray(position, dtype=int)
+        self.site_start = numpy.asarray(site_start, dtype=int)
+        self.site_end = numpy.asarray(site_end, dtype=int)
+        G = len(self.site_start)
+
+        if columns is not None:
+            for name in self.COLUMNS:
+                setattr(self, name, numpy.asarray(columns[name]))
+            return
+
+        tosses = tossify(data)
+        if scipy.sparse.issparse(data):
+            site_reps = numpy.asarray((data > 0).sum(0)).ravel()
+        else:
+            site_reps = numpy.sum(data > 0, 0)
+        cum_tosses = numpy.concatenate(([0], numpy.cumsum(tosses, dtype=int)))
+        cum_reps = numpy.concatenate(([0], numpy.cumsum(site_reps, dtype=int)))
+
+        self.n = self.site_end - self.site_start
+        self.k = cum_tosses[self.site_end] - cum_tosses[self.site_start]
+        self.k_reps = cum_reps[self.site_end] - cum_reps[self.site_start]
+
+        nonempty = self.n > 0
+        (self.r, run_end) = rle_tools.segment_max_runs(tosses, self.site_start, self.site_end)
+
+        # The gap span is measured on the last of the maximum runs.
+        self.s = numpy.zeros(G, dtype=int)
+        has_run = run_end >= 0
+        run_start = run_end[has_run] - self.r[has_run] + 1
+        self.s[has_run] = position[run_end[has_run]] - position[run_start] + 2
+
+        self.t = numpy.zeros(G, dtype=int)
+        self.t[nonempty] = position[self.site_end[nonempty] - 1] - position[self.site_start[nonempty]] + 2
+
+        self.theta = numpy.zeros(G)
+        self.theta[nonempty] = self.k[nonempty]/self.n[nonempty].astype(float)
+        self.phi = 1.0 - self.theta
+
+#
+
+    def __len__(self):
+        """Defines __len__ returning number of genes.
+
+        Returns:
+            int: Number of genes in the table.
+        """
+        return len(self.n)
+
+#
+
+class AnnotationIndex:
+    """Class defining a sorted-interval index over the genes of an annotation.
+
+    This class replaces the per-coordinate dictionaries of get_pos_hash: the
+    genes are stored as arrays of coordinates sorted by start, and positions
+    are mapped to the genes containing them with numpy.searchsorted. Lookups
+    return genes in annotation file order, like the lists of get_pos_hash.
+
+    Genes are grouped in classes of similar length (powers of four), and each
+    class is searched only within its own maximum length of the coordinate.
+    A few long features (e.g. a genome-spanning GFF3 "region" record) thus
+    only add their own hits, instead of widening the search for every gene.
+
+    Attributes:
+        orf: List of the gene ids, in annotation file order.
+        start: Numpy array of start coordinates, in annotation file order.
+        end: Numpy array of end coordinates, in annotation file order.
+
+
+    :Example:
+
+        >>> import pytransit.tnseq_tools as tnseq_tools
+        >>> index = tnseq_tools.get_annotation_index("transit/genomes/H37Rv.prot_table")
+        >>> print index.get(60)
+        ['Rv0001']
+        >>> print index.overlap(1500, 2100)
+        ['Rv0001', 'Rv0002']
+
+        .. seealso:: :class:`get_annotation_index` :class:`get_pos_hash`
+        """
+
+    def __init__(self, orf, start, end):
+        """Initializes the index from the coordinates of the genes.
+
+        Arguments:
+            orf (list): List of gene ids.
+            start (list): List of start coordinates of the genes.
+            end (list): List of end coordinates of the genes.
+        """
+        self.orf = list(orf)
+        self.start = numpy.array(start, dtype=int)
+        self.end = numpy.array(end, dtype=int)
+
+        # Genes sorted by start within each length class; a gene of the class
+        # can only contain a coordinate if it starts at most max_length-1 before it.
+        length = numpy.maximum(self.end - self.start + 1, 1)
+        length_class = numpy.ceil(numpy.log2(length)/2.0).astype(int)
+        self.classes = []
+        for c in numpy.unique(length_class):
+            ii_class = numpy.flatnonzero(length_class == c)
+            order = ii_class[numpy.argsort(self.start[ii_class], kind="mergesort")]
+            self.classes.append((order, self.start[order], self.end[order], int(numpy.max(length[ii_class]))))
+
+#
+
+    def __len__(self):
+        """Defines __len__ returning number of genes.
+
+        Returns:
+            int: Number of genes in the index.
+        """
+        return len(self.orf)
+
+#
+
+    def __contains__(self, pos):
+        """Defines __contains__ to check if any gene contains the coordinate.
+
+        Arguments:
+            pos (int): Coordinate to check.
+
+        Returns:
+            bool: Boolean with True if the coordinate is covered by a gene.
+        """
+        return len(self.lookup([pos])[0]) > 0
+
+#
+
+    def get(self, pos, default=None):
+        """Returns the list of genes containing the coordinate; works like dict.get of get_pos_hash.
+
+        Arguments:
+            pos (int): Coordinate of interest.
+            default: Value returned if no gene contains the coordinate.
+
+        Returns:
+            list: List of the ids of the genes containing the coordinate.
+        """
+        (ii_site, ii_gene) = self.lookup([pos])
+        if len(ii_gene) == 0:
+            return default
+        return [self.orf[g] for g in ii_gene]
+
+#
+
+    def lookup(self, position):
+        """Maps coordinates to the genes that contain them.
+
+        Arguments:
+            position (list): List (or numpy array) of coordinates.
+
+        Returns:
+            tuple: Two numpy arrays (site index, gene index) with one entry per
+                (coordinate, gene) pair, sorted by site index and then by the
+                order of the genes in the annotation. Gene indexes refer to orf.
+        """
+        position = numpy.asarray(position, dtype=int).ravel()
+        pairs = []
+        for (order, sorted_start, sorted_end, max_length) in self.classes:
+            lo = numpy.searchsorted(sorted_start, position - max_length + 1, side="left")
+            hi = numpy.searchsorted(sorted_start, position, side="right")
+            counts = hi - lo
+            ii_site = numpy.repeat(numpy.arange(len(position)), counts)
+            offsets = numpy.arange(len(ii_site)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            ii_sorted = numpy.repeat(lo, counts) + offsets
+            ii_hit = sorted_end[ii_sorted] >= position[ii_site]
+            if numpy.any(ii_hit):
+                pairs.append((ii_site[ii_hit], order[ii_sorted[ii_hit]]))
+        if not pairs:
+            return (numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int))
+        ii_site = numpy.concatenate([p[0] for p in pairs])
+        ii_gene = numpy.concatenate([p[1] for p in pairs])
+        # Pairs of a single class are sorted by site already; genes of the same
+        # site only need to be reordered if the annotation is not sorted by start.
+        if len(pairs) > 1 or numpy.any((numpy.diff(ii_site) == 0) & (numpy.diff(ii_gene) < 0)):
+            ii = numpy.argsort(ii_site * len(self.orf) + ii_gene)
+            (ii_site, ii_gene) = (ii_site[ii], ii_gene[ii])
+        return (ii_site, ii_gene)
+
+#
+
+    def genes_at(self, position):
+        """Returns the list of genes containing each of the coordinates.
+
+        Arguments:
+            position (list): List (or numpy array) of coordinates.
+
+        Returns:
+            list: List with a list of gene ids for every coordinate.
+        """
+        (ii_site, ii_gene) = self.lookup(position)
+        bounds = numpy.searchsorted(ii_site, numpy.arange(len(position) + 1))
+        return [[self.orf[g] for g in ii_gene[bounds[i]:bounds[i+1]]] for i in xrange(len(position))]
+
+#
+
+    def overlap(self, start, end):
+        """Returns the genes that overlap a range of coordinates.
+
+        Arguments:
+            start (int): Start coordinate of the desired range.
+            end (int): End coordinate of the desired range.
+
+        Returns:
+            list: Sorted list of the ids of the genes that overlap the range.
+        """
+        result = set()
+        for (order, sorted_start, sorted_end, max_length) in self.classes:
+            lo = numpy.searchsorted(sorted_start, start - max_length + 1, side="left")
+            hi = numpy.searchsorted(sorted_start, end, side="right")
+            ii_sorted = numpy.arange(lo, max(lo, hi))
+            result.update(self.orf[g] for g in order[ii_sorted[sorted_end[ii_sorted] >= start]])
+        return sorted(result)
+
+#
+
+class Annotation:
+    """Class defining the genes of an annotation file, parsed once into arrays.
+
+    The prot_table or GFF3 file is read a single time, and the coordinates and
+    information of its genes are kept in annotation file order. The helpers
+    get_gene_info, get_pos_hash and get_annotation_index are views over this
+    object, which is shared (see :func:`get_annotation`) by all of them.
+
+    Attributes:
+        path: String with the path to the annotation file.
+        orf: List of the gene ids.
+        name: List of the gene names.
+        desc: List of the gene descriptions.
+        start: Numpy array of the start coordinates.
+        end: Numpy array of the end coordinates.
+        strand: List of the strands of the genes.
+
+
+    :Example:
+
+        >>> import pytransit.tnseq_tools as tnseq_tools
+        >>> A = tnseq_tools.get_annotation("transit/genomes/H37Rv.prot_table")
+        >>> print A
+        Annotation Object (N=3990)
+        >>> print A.orf[0], A.name[0], A.start[0], A.end[0], A.strand[0]
+        Rv0001 dnaA 1 1524 +
+
+        .. seealso:: :class:`get_annotation` :class:`AnnotationIndex`
+        """
+
+    def __init__(self, path, isProt=None):
+        """Parses the annotation file.
+
+        Arguments:
+            path (str): Path to annotation in .prot_table or GFF3 format.
+            isProt (bool): Boolean specifying whether the file is in .prot_table
+                format. By default, determined from the extension of the file.
+        """
+        if isProt is None:
+            filename, file_extension = os.path.splitext(path)
+            isProt = file_extension.lower() not in [".gff", ".gff3"]
+        self.path = path
+        self.isProt = isProt
+        self.orf, self.name, self.desc, self.strand = [], [], [], []
+        start, end = [], []
+        for line in open(path):
+            if line.startswith("#"): continue
+            tmp = line.strip().split("\t")
+            if isProt:
+                self.orf.append(tmp[8])
+                self.name.append(tmp[7])
+                self.desc.append(tmp[0])
+                start.append(int(tmp[1]))
+                end.append(int(tmp[2]))
+                self.strand.append(tmp[3])
+            else:
+                features = dict([tuple(f.split("=",1)) for f in filter(lambda x: "=" in x, tmp[8].split(";"))])
+                if "ID" not in features: continue
+                name = features.get("Name", "-")
+                if name == "-": name = features.get("name", "-")
+
+                desc = features.get("Description", "-")
+                if desc == "-": desc = features.get("description", "-")
+                if desc == "-": desc = features.get("Desc", "-")
+                if desc == "-": desc = features.get("desc", "-")
+                if desc == "-": desc = features.get("product", "-")
+
+                self.orf.append(features["ID"])
+                self.name.append(name)
+                self.desc.append(desc)
+                start.append(int(tmp[3]))
+                end.append(int(tmp[4]))
+                self.strand.append(tmp[6])
+        self.start = numpy.array(start, dtype=int)
+        self.end = numpy.array(end, dtype=int)
+        self._index = None
+
+#
+
+    def __len__(self):
+        """Defines __len__ returning number of genes.
+
+        Returns:
+            int: Number of genes in the annotation.
+        """
+        return len(self.orf)
+
+#
+
+    def __str__(self):
+        """Defines __str__ to print a generic str with the size of the annotation.
+
+        Returns:
+            str: Human readable string with number of genes in object.
+        """
+        return "Annotation Object (N=%d)" % len(self.orf)
+
+#
+
+    def gene_info(self):
+        """Returns a dictionary that maps gene id to gene information (see get_gene_info).
+
+        Returns:
+            dict: Dictionary of gene id to tuple of (name, description, start, end, strand).
+        """
+        return dict(zip(self.orf, zip(self.name, self.desc, self.start.tolist(), self.end.tolist(), self.strand)))
+
+#
+
+    def pos_hash(self):
+        """Returns a dictionary that maps coordinates to a list of genes (see get_pos_hash).
+
+        Returns:
+            dict: Dictionary of position to list of genes that share that position.
+        """
+        hash = {}
+        for (orf, start, end) in zip(self.orf, self.start.tolist(), self.end.tolist()):
+            for pos in range(start, end+1):
+                if pos not in hash: hash[pos] = []
+                hash[pos].append(orf)
+        return hash
+
+#
+
+    def index(self):
+        """Returns the interval index of the genes (see get_annotation_index).
+
+        Returns:
+            AnnotationIndex: Index of the genes in the annotation.
+        """
+        if self._index is None:
+            self._index = AnnotationIndex(self.orf, self.start, self.end)
+        return self._index
+
+#
+
 def tossify(data):
     """Reduces the data into Bernoulli trials (or 'tosses') based on whether counts were observed or not.
 
     Arguments:
-        data (list): List of numeric data.
+        data (list): List of numeric data. May be a scipy.sparse matrix.
 
     Returns:
         list: Data represented as bernoulli trials with >0 as true.
     """
     K,N = data.shape
-    reduced = numpy.sum(data,0)
+    if scipy.sparse.issparse(data):
+        tosses = numpy.zeros(N)
+        tosses[rle_tools.insertion_sites(data)[0]] = 1
+        return tosses
     return numpy.zeros(N) + (numpy.sum(data, 0) > 0)
 
 #
@@ -637,28 +1173,14 @@ def runs(data):
     """Return list of all the runs of consecutive non-insertions.
 
     Arguments:
-        data (list): List of numeric data.
+        data (list): List of numeric data. May be a (1,N) scipy.sparse matrix.
 
     Returns:
         list: List of the length of the runs of non-insertions. Non-zero sites are treated as runs of zero.
-    """
-    runs = []
-    current_r = 0
-    for read in data:
-        if read > 0: # If ending a run of zeros
-            if current_r > 0: # If we were in a run, add to list
-                runs.append(current_r)
-            current_r = 0
-            runs.append(current_r)
-        else:
-            current_r += 1
-    # If we ended in a run, add it
-    if current_r > 0:
-        runs.append(current_r)
 
-    if not runs:
-        return [0]
-    return runs
+    .. seealso:: :class:`pytransit.rle_tools.runs` :class:`pytransit.rle_tools.zero_runs`
+    """
+    return rle_tools.runs(data)
 
 #
 
@@ -671,19 +1193,7 @@ def runindex(runs):
     Returns:
         list: List of the index of the runs of non-insertions. Non-zero sites are treated as runs of zero.
     """
-    index = 0
-    index_list = []
-    runindex = 0
-    for r in runs:
-        for i in range(r):
-            if i == 0:
-                runindex = index
-            index+=1
-        if r == 0:
-            runindex = index
-            index+=1
-        index_list.append(runindex)
-    return index_list
+    return rle_tools.runindex(runs)
 
 #
 
@@ -701,15 +1211,10 @@ def get_file_types(wig_list):
     
     types = ['tn5' for i in range(len(wig_list))]
     for i, wig_filename in enumerate(wig_list):
-        with open(wig_filename) as wig_file:
-            prev_pos = 0
-            for line in wig_file:
-                if line[0] not in "0123456789": continue
-                tmp = line.split()
-                pos = int(tmp[0])
-                rd = float(tmp[1])
-                if pos != prev_pos + 1: types[i] = 'himar1'
-                prev_pos = pos
+        (position, reads) = read_wig(wig_filename, prune=False)
+        # Tn5 datasets have every coordinate (starting at 1) as a possible site.
+        if numpy.any(numpy.diff(numpy.concatenate(([0], position))) != 1): types[i] = 'himar1'
+    prune_wig_cache(wig_list)
     return types
 
 #
@@ -724,12 +1229,399 @@ def get_unknown_file_types(wig_list, transposons):
 
 #
 
-def get_data(wig_list):
+def wig_cache_key(path):
+    """Returns the key identifying the cached copy of the given wig file.
+
+    The key is derived from the absolute path, size and modification time of the
+    file, so the cache is invalidated whenever the file changes.
+
+    Arguments:
+        path (str): Path to the wig file.
+
+    Returns:
+        str: Hexadecimal string with the cache key.
+    """
+    st = os.stat(path)
+    text = "%s|%d|%r" % (os.path.abspath(path), st.st_size, st.st_mtime)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+#
+
+def open_wig(path):
+    """Opens a wig file for reading, transparently decompressing it if needed.
+
+    Files compressed with gzip, bzip2 or xz are detected by their magic bytes
+    (regardless of their extension) and decoded on the fly, using buffered
+    block reads. Reading xz files requires the lzma module (backports.lzma
+    in python 2).
+
+    Arguments:
+        path (str): Path to the (possibly compressed) wig file.
+
+    Returns:
+        file: File-like object with the uncompressed contents of the wig file.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    if magic.startswith(b"\x1f\x8b"):
+        return io.BufferedReader(gzip.GzipFile(path, "rb"), WIG_BUFFER_SIZE)
+    elif magic.startswith(b"BZh"):
+        return bz2.BZ2File(path, "r", WIG_BUFFER_SIZE)
+    elif magic.startswith(b"\xfd7zXZ\x00"):
+        if not hasLzma:
+            raise IOError("Cannot read '%s': reading xz-compressed files requires the lzma module (pip install backports.lzma)." % path)
+        return io.BufferedReader(lzma.LZMAFile(path, "rb"), WIG_BUFFER_SIZE)
+    return open(path, "rb", WIG_BUFFER_SIZE)
+
+#
+
+def parse_wig_text(text):
+    """Converts the text of a wig file (or of a block of its lines) to arrays.
+
+    Header and comment lines are stripped out and the remaining "coordinate
+    read-count" pairs are converted to numbers in one pass by numpy.
+
+    Arguments:
+        text (str): String with the contents of the wig file.
+
+    Returns:
+        tuple: Two numpy arrays, with the coordinates and read-counts of the sites.
+    """
+    nlines = len(WIG_DATA_LINE.findall(text))
+    values = numpy.fromstring(WIG_OTHER_LINE.sub("", text), sep=" ")
+    if len(values) != 2*nlines:
+        # Irregular file (e.g. extra columns); fall back to splitting each line.
+        lines = [line for line in text.splitlines() if line[:1].isdigit()]
+        values = numpy.array([line.split()[:2] for line in lines], dtype=float)
+    values = values.reshape((nlines, 2))
+    return (values[:,0].astype(numpy.int64), values[:,1].copy())
+
+#
+
+def parse_wig(path):
+    """Parses the read-counts in the given (possibly compressed) wig file, read as a single buffer.
+
+    Arguments:
+        path (str): Path to the wig file.
+
+    Returns:
+        tuple: Two numpy arrays, with the coordinates and read-counts of the sites.
+
+    .. seealso:: :class:`parse_wig_text`
+    """
+    with open_wig(path) as wig_file:
+        return parse_wig_text(wig_file.read())
+
+#
+
+def wig_cache_files(path):
+    """Returns the paths of the cached copy of the given wig file, or an empty list.
+
+    The read-counts are stored as <key>_reads_<sites>.npy, where <key> is the
+    :func:`wig_cache_key` of the file and <sites> identifies the coordinates,
+    which are stored once as <sites>_sites.npy for all the replicates sharing
+    them.
+
+    Arguments:
+        path (str): Path to the wig file.
+
+    Returns:
+        list: Paths to the read-counts and coordinates files.
+    """
+    key = wig_cache_key(path)
+    for reads_path in glob.glob(os.path.join(cache_dir, key + "_reads_*.npy")):
+        sites_key = os.path.basename(reads_path)[len(key) + len("_reads_"):-len(".npy")]
+        sites_path = os.path.join(cache_dir, sites_key + "_sites.npy")
+        if os.path.exists(sites_path):
+            return [reads_path, sites_path]
+    return []
+
+#
+
+def read_wig(path, prune=True):
+    """Returns the coordinates and read-counts in the given wig file.
+
+    If the cache is enabled (see :data:`use_cache` and :data:`cache_dir`), the
+    parsed arrays are stored as .npy files keyed by path, size and modification
+    time, and later calls load them instead of parsing the text again. The
+    coordinates are stored once for all the files sharing them (memory-mapped
+    on load), and integer read-counts are stored as uint32 (see
+    :func:`wig_cache_files`).
+
+    Arguments:
+        path (str): Path to the wig file.
+        prune (bool): Whether to prune the cache after writing to it (see
+            :func:`prune_cache`). Functions reading several files at once prune
+            it themselves, keeping the files they just used.
+
+    Returns:
+        tuple: Two numpy arrays, with the coordinates and read-counts of the sites.
+
+    .. seealso:: :class:`get_data` :class:`parse_wig`
+    """
+    if not use_cache:
+        return parse_wig(path)
+
+    cached_files = wig_cache_files(path)
+    if cached_files:
+        try:
+            (reads_path, sites_path) = cached_files
+            position = numpy.load(sites_path, mmap_mode="r")
+            reads = numpy.load(reads_path, mmap_mode="r")
+            if reads.dtype != float:
+                reads = reads.astype(float)
+            for cached_path in cached_files:
+                touch_cache(cached_path)
+            return (position, reads)
+        except (IOError, ValueError):
+            pass
+
+    (position, reads) = parse_wig(path)
+    stored_reads = reads
+    if len(reads) and reads.min() >= 0 and reads.max() <= numpy.iinfo(COMPACT_COUNT_DTYPE).max and not numpy.any(reads % 1):
+        stored_reads = reads.astype(COMPACT_COUNT_DTYPE)
+    sites_key = hashlib.sha1(numpy.ascontiguousarray(position).tostring()).hexdigest()
+    sites_path = os.path.join(cache_dir, sites_key + "_sites.npy")
+    reads_path = os.path.join(cache_dir, "%s_reads_%s.npy" % (wig_cache_key(path), sites_key))
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        arrays = [(stored_reads, reads_path)]
+        if os.path.exists(sites_path):
+            touch_cache(sites_path)
+        else:
+            arrays.append((position, sites_path))
+        for (arr, arr_path) in arrays:
+            # Write to a temporary file first so other processes never see partial files.
+            (fd, tmp_path) = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmp_file:
+                numpy.save(tmp_file, arr)
+            os.rename(tmp_path, arr_path)
+    except (IOError, OSError) as e:
+        warnings.warn("Could not write the cache for '%s': %s" % (path, e))
+    if prune:
+        prune_cache(keep=[reads_path, sites_path])
+    return (position, reads)
+
+#
+
+def prune_wig_cache(wig_list):
+    """Prunes the cache after reading the given wig files, keeping their cached copies.
+
+    Arguments:
+        wig_list (list): List of paths to wig files read with prune=False.
+    """
+    if use_cache:
+        keep = []
+        for path in wig_list:
+            keep.extend(wig_cache_files(path))
+        prune_cache(keep=keep)
+
+#
+
+def touch_cache(path):
+    """Marks the given cache file as recently used, so :func:`prune_cache` keeps it longer.
+
+    Arguments:
+        path (str): Path to a file in the cache directory.
+    """
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+#
+
+def prune_cache(max_size=None, keep=[]):
+    """Removes the least recently used files from the cache directory until it fits in the given size.
+
+    The files in use by the current operation are given in keep, and are never
+    removed, so the cache may exceed the maximum size by its working set.
+
+    Arguments:
+        max_size (int): Maximum total size of the cache, in bytes. Defaults to
+            the module-level :data:`cache_max_size` setting.
+        keep (list): Paths to files that must not be removed.
+
+    Returns:
+        int: Number of files removed.
+    """
+    if max_size is None:
+        max_size = cache_max_size
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return 0
+
+    keep = set(os.path.abspath(path) for path in keep)
+    entries = []
+    total = 0
+    for name in names:
+        # Temporary files are still being written by some process.
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        total += st.st_size
+        if os.path.abspath(path) not in keep:
+            entries.append((st.st_mtime, st.st_size, path))
+
+    removed = 0
+    for (mtime, size, path) in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+#
+
+def genes_cache_key(wig_list, annotation, norm, reps, minread, ignoreCodon, nterm, cterm, compact=False):
+    """Returns the key identifying the cached copy of a Genes object.
+
+    The key is derived from the absolute path, size and modification time of
+    the wig files, the annotation and the normalization factors file (if set),
+    and from the parameters used to build the object, so the cache is
+    invalidated whenever any of them changes.
+
+    Arguments:
+        wig_list (list): List of paths to wig files.
+        annotation (str): Path to the annotation.
+        norm (str): Normalization method.
+        reps (str): How replicates are handled.
+        minread (int): Minimum magnitude of read-count considered.
+        ignoreCodon (bool): Whether the start/stop codon is ignored.
+        nterm (float): Fraction of the N-terminus ignored.
+        cterm (float): Fraction of the C-terminus ignored.
+        compact (bool): Whether the read-counts are held in compact form.
+
+    Returns:
+        str: Hexadecimal string with the cache key.
+    """
+    parts = []
+    for path in list(wig_list) + [annotation]:
+        st = os.stat(path)
+        parts.append("%s|%d|%r" % (os.path.abspath(path), st.st_size, st.st_mtime))
+    parts.append("%s|%s|%r|%r|%r|%r|%r" % (norm, reps, minread, bool(ignoreCodon), float(nterm), float(cterm), bool(compact)))
+    # Factors files (see norm_tools.factors_file) replace the computed factors.
+    if not noNorm and norm_tools.factors_file:
+        path = norm_tools.factors_file
+        if os.path.exists(path):
+            st = os.stat(path)
+            parts.append("factors|%s|%d|%r" % (os.path.abspath(path), st.st_size, st.st_mtime))
+        else:
+            parts.append("factors|%s" % os.path.abspath(path))
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+#
+
+def _load_genes_cache(path):
+    """Returns the arrays of a cached Genes object, or None if it cannot be read.
+
+    Arguments:
+        path (str): Path to the .npz file written by :func:`_save_genes_cache`.
+
+    Returns:
+        tuple: Data, position, site_start, site_end, GeneTable and normalization
+            factors of the genes.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        cached = numpy.load(path)
+        try:
+            arrays = dict((name, cached[name]) for name in cached.files)
+        finally:
+            cached.close()
+        table = GeneTable(None, arrays["position"], arrays["site_start"], arrays["site_end"], columns=arrays)
+        touch_cache(path)
+        return (arrays["data"], arrays["position"], table.site_start, table.site_end, table, arrays["factors"])
+    except (IOError, ValueError, KeyError) as e:
+        warnings.warn("Could not read the cached genes '%s': %s" % (path, e))
+        return None
+
+#
+
+def _save_genes_cache(path, data, position, table, factors):
+    """Writes the arrays of a Genes object to the cache (see :func:`_load_genes_cache`).
+
+    The normalization factors are stored too, so that a cached Genes object
+    can still write them to a factors file.
+
+    Arguments:
+        path (str): Path to the .npz file.
+        data (numpy array): (K,N) numpy array of (normalized) read-counts.
+        position (list): List of coordinates of the N sites.
+        table (GeneTable): Statistics of the genes.
+        factors (numpy array): Normalization factors of the datasets.
+    """
+    arrays = dict((name, getattr(table, name)) for name in GeneTable.COLUMNS)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write to a temporary file first so other processes never see partial files.
+        (fd, tmp_path) = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            numpy.savez(tmp_file, data=data, position=position, site_start=table.site_start, site_end=table.site_end, factors=numpy.asarray(factors), **arrays)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        warnings.warn("Could not write the cached genes '%s': %s" % (path, e))
+    prune_cache()
+
+#
+
+def _replicate_error(path, first_path, position, reads, first_position, compact):
+    """Returns a message describing why the replicate cannot be added to the matrix, or None."""
+    if len(position) != len(first_position) or numpy.any(position != first_position):
+        return "The coordinates in '%s' do not match those in '%s'." % (path, first_path)
+    if compact and (numpy.any(reads < 0) or numpy.any(reads % 1) or numpy.any(reads > numpy.iinfo(COMPACT_COUNT_DTYPE).max)):
+        return "The read-counts in '%s' are not non-negative integers, and cannot be loaded in compact mode." % path
+    return None
+
+#
+
+def _init_shared_data(shared_data, first_path, first_position, compact):
+    """Stores the shared (K,T) buffer and the first dataset's coordinates in a worker process."""
+    global _shared_data, _shared_args
+    _shared_data = shared_data
+    _shared_args = (first_path, first_position, compact)
+
+#
+
+def _load_shared_replicate(args):
+    """Parses one wig file into its row of the shared buffer. Returns an error message, or None."""
+    (j, path) = args
+    (first_path, first_position, compact) = _shared_args
+    (position, reads) = read_wig(path, prune=False)
+    error = _replicate_error(path, first_path, position, reads, first_position, compact)
+    if error:
+        return error
+    dtype = COMPACT_COUNT_DTYPE if compact else float
+    data = numpy.frombuffer(_shared_data, dtype=dtype).reshape((-1, len(first_position)))
+    data[j,:] = reads
+    return None
+
+#
+
+def get_data(wig_list, workers=None, compact=None):
     """ Returns a tuple of (data, position) containing a matrix of raw read-counts
         , and list of coordinates. 
 
     Arguments:
         wig_list (list): List of paths to wig files.
+        workers (int): Number of worker processes used to parse the files. The
+            matrix is assembled in shared memory. Defaults to the module-level
+            :data:`default_workers` setting.
+        compact (bool): Boolean specifying whether to hold the read-counts as
+            uint32 instead of float64, which requires integer read-counts.
+            Defaults to the module-level :data:`default_compact` setting.
 
     Returns:
         tuple: Two lists containing data and positions of the wig files given.
@@ -745,85 +1637,255 @@ def get_data(wig_list):
     .. seealso:: :class:`get_file_types` :class:`combine_replicates` :class:`get_data_zero_fill` :class:`pytransit.norm_tools.normalize_data`
     """
     K = len(wig_list)
-    T = 0
+    if workers is None:
+        workers = default_workers
+    if compact is None:
+        compact = default_compact
 
     if not wig_list:
         return (numpy.zeros((1,0)), numpy.zeros(0), [])
 
-    for line in open(wig_list[0]):
-        if line[0] not in "0123456789": continue
-        T+=1
-    
-    data = numpy.zeros((K,T))
-    position = numpy.zeros(T, dtype=int)
-    for j,path in enumerate(wig_list):
-        reads = []
-        i = 0
-        prev_pos = 0
-        for line in open(path):
-            if line[0] not in "0123456789": continue
-            tmp = line.split()
-            pos = int(tmp[0])
-            rd = float(tmp[1])
-            prev_pos = pos
-            data[j,i] = rd
-            position[i] = pos
-            i+=1
-    return (data, position)
+    (position, reads) = read_wig(wig_list[0], prune=False)
+    T = len(position)
+    error = _replicate_error(wig_list[0], wig_list[0], position, reads, position, compact)
+    if error:
+        raise ValueError(error)
+
+    dtype = COMPACT_COUNT_DTYPE if compact else float
+    if workers > 1 and K > 1:
+        shared_data = multiprocessing.sharedctypes.RawArray("I" if compact else "d", K*T)
+        data = numpy.frombuffer(shared_data, dtype=dtype).reshape((K,T))
+        data[0,:] = reads
+        pool = multiprocessing.Pool(min(workers, K-1), _init_shared_data, (shared_data, wig_list[0], numpy.array(position), compact))
+        try:
+            errors = pool.map(_load_shared_replicate, list(enumerate(wig_list))[1:])
+        finally:
+            pool.close()
+            pool.join()
+        for error in errors:
+            if error:
+                raise ValueError(error)
+    else:
+        data = numpy.zeros((K,T), dtype=dtype)
+        data[0,:] = reads
+        for j,path in enumerate(wig_list[1:], 1):
+            (pos_j, reads_j) = read_wig(path, prune=False)
+            error = _replicate_error(path, wig_list[0], pos_j, reads_j, position, compact)
+            if error:
+                raise ValueError(error)
+            data[j,:] = reads_j
+    prune_wig_cache(wig_list)
+    return (data, numpy.array(position, dtype=int))
 
 #
 
-def get_data_zero_fill(wig_list):
+def iter_wig_blocks(path, chunk_size=100000):
+    """Yields the sites of the given wig file in blocks, without reading the whole file.
+
+    Arguments:
+        path (str): Path to the wig file.
+        chunk_size (int): Number of sites in each block.
+
+    Returns:
+        generator: Tuples with the coordinates and read-counts of the next block of sites.
+    """
+    with open_wig(path) as wig_file:
+        lines = (line for line in wig_file if line[:1].isdigit())
+        while True:
+            block = list(itertools.islice(lines, chunk_size))
+            if not block:
+                break
+            yield parse_wig_text(b"".join(block))
+
+#
+
+def iter_data(wig_list, chunk_size=100000, window=None):
+    """Yields tuples of (data, position) over consecutive blocks of the genome.
+
+    The wig files are streamed in lock-step, so only one block of sites is held
+    in memory at a time. This is useful for analyses that are inherently local
+    (e.g. per-gene statistics, or writing the combined wig file) on datasets
+    with many replicates.
+
+    Arguments:
+        wig_list (list): List of paths to wig files.
+        chunk_size (int): Number of sites read at a time.
+        window (int): If given, blocks are instead aligned to genomic windows of
+            this many nucleotides (i.e. coordinates 1..window, window+1..2*window, etc).
+            Windows without any sites are skipped.
+
+    Returns:
+        generator: Tuples with a (K,n) matrix of read-counts and the n coordinates of the block.
+
+    :Example:
+
+        >>> import pytransit.tnseq_tools as tnseq_tools
+        >>> for (data, position) in tnseq_tools.iter_data(["data/glycerol_H37Rv_rep1.wig", "data/glycerol_H37Rv_rep2.wig"], window=1000000):
+        ...     print data.shape, position[0], position[-1]
+        (2, 16955) 60 999976
+        (2, 17179) 1000043 1999984
+        ...
+
+    .. seealso:: :class:`get_data`
+    """
+    blocks = _iter_site_blocks(wig_list, chunk_size)
+    if not window:
+        for block in blocks:
+            yield block
+        return
+
+    pending = []
+    pending_id = None
+    for (data, position) in blocks:
+        ids = (position - 1) // window
+        bounds = [0] + list(numpy.flatnonzero(numpy.diff(ids)) + 1) + [len(ids)]
+        for (a, b) in zip(bounds[:-1], bounds[1:]):
+            if pending and ids[a] != pending_id:
+                yield (numpy.hstack([d for (d, p) in pending]), numpy.concatenate([p for (d, p) in pending]))
+                pending = []
+            pending.append((data[:,a:b], position[a:b]))
+            pending_id = ids[a]
+    if pending:
+        yield (numpy.hstack([d for (d, p) in pending]), numpy.concatenate([p for (d, p) in pending]))
+
+#
+
+def _iter_site_blocks(wig_list, chunk_size):
+    """Yields (data, position) blocks of chunk_size sites, reading the wig files in lock-step."""
+    readers = [iter_wig_blocks(path, chunk_size) for path in wig_list]
+    for blocks in itertools.izip_longest(*readers):
+        if None in blocks:
+            raise ValueError("The wig files '%s' do not have the same number of sites." % "', '".join(wig_list))
+        position = blocks[0][0]
+        data = numpy.zeros((len(wig_list), len(position)))
+        for j,(pos_j, reads_j) in enumerate(blocks):
+            if len(pos_j) != len(position) or numpy.any(pos_j != position):
+                raise ValueError("The coordinates in '%s' do not match those in '%s'." % (wig_list[j], wig_list[0]))
+            data[j,:] = reads_j
+        yield (data, numpy.array(position, dtype=int))
+
+#
+
+def iter_genes(wig_list, annotation, factors=None, minread=1, reps="All", ignoreCodon=True, nterm=0.0, cterm=0.0, chunk_size=100000):
+    """Yields the genes of the annotation, reading the wig files in blocks of sites.
+
+    Each gene is yielded as soon as all of its sites have been read, as a Gene
+    object holding its own copy of the read-counts. Only the sites of the genes
+    not yet complete are kept between blocks, so memory is bounded by the block
+    size and the longest gene instead of the size of the genome. The genes are
+    the same as those of :class:`Genes` with the same arguments, but they are
+    yielded in order of their end coordinate.
+
+    Arguments:
+        wig_list (list): List of paths to wig files.
+        annotation (str): Path to annotation in .prot_table or GFF3 format.
+        factors (numpy array): (K,1) normalization factors of the datasets (e.g.
+            from :func:`pytransit.norm_tools.stream_factors`). Not normalized by
+            default.
+        minread (int): Minimum read-count considered an insertion.
+        reps (str): How to handle replicates: "All", "Sum" or "Mean".
+        ignoreCodon (bool): Boolean defining whether to ignore the start/stop codon.
+        nterm (float): Float number of the percentage of the N-terminus to ignore.
+        cterm (float): Float number of the percentage of the C-terminus to ignore.
+        chunk_size (int): Number of sites read at a time.
+
+    Returns:
+        generator: Gene objects, one for each entry of the annotation.
+
+    .. seealso:: :class:`Genes` :class:`iter_data`
+    """
+    if reps.lower() not in ("all", "sum", "mean"):
+        raise ValueError("Replicates cannot be combined with '%s' when reading the datasets in blocks." % reps)
+    annotation_obj = get_annotation(annotation)
+    orf2info = get_gene_info(annotation)
+    last_entry = dict((orf, g) for (g, orf) in enumerate(annotation_obj.orf))
+    info = numpy.array([last_entry[orf] for orf in annotation_obj.orf], dtype=int)
+    gene_start = numpy.minimum(annotation_obj.start, annotation_obj.end)[info]
+    gene_end = numpy.maximum(annotation_obj.start, annotation_obj.end)[info]
+    # Genes in order of their end, and the smallest start of each suffix of
+    # that order, i.e. the first coordinate still needed by the pending genes.
+    pending = numpy.argsort(gene_end, kind="mergesort")
+    needed_start = numpy.minimum.accumulate(gene_start[pending][::-1])[::-1]
+
+    buffer_data = numpy.zeros((len(wig_list) if reps.lower() == "all" else 1, 0))
+    buffer_position = numpy.zeros(0, dtype=int)
+    i_next = 0
+    blocks = _iter_site_blocks(wig_list, chunk_size)
+    for block in itertools.chain(blocks, [None]):
+        if block is not None:
+            (data, position) = block
+            data[data < minread] = 0
+            if factors is not None:
+                data = numpy.reshape(factors, (-1,1)) * data
+            if reps.lower() != "all":
+                data = numpy.array([combine_replicates(data, method=reps)])
+            buffer_data = numpy.hstack((buffer_data, data))
+            buffer_position = numpy.concatenate((buffer_position, position))
+            i_last = numpy.searchsorted(gene_end[pending], position[-1], side="right")
+        else:
+            i_last = len(pending)
+
+        if i_last > i_next:
+            (site_start, site_end) = get_gene_site_ranges(annotation_obj, buffer_position, ignoreCodon, nterm, cterm)
+            for g in pending[i_next:i_last]:
+                gene = annotation_obj.orf[g]
+                name,desc,start,end,strand = orf2info.get(gene, ["", "", 0, 0, "+"])
+                if site_end[g] > site_start[g]:
+                    yield Gene(gene, name, desc, buffer_data[:, site_start[g]:site_end[g]].copy(), buffer_position[site_start[g]:site_end[g]].copy(), start, end, strand)
+                else:
+                    yield Gene(gene, name, desc, numpy.array([[]]), numpy.array([]), start, end, strand)
+            i_next = i_last
+
+        # Keep only the sites that the pending genes may still need.
+        if i_next < len(pending):
+            cut = numpy.searchsorted(buffer_position, needed_start[i_next], side="left")
+        else:
+            cut = len(buffer_position)
+        buffer_data = buffer_data[:, cut:]
+        buffer_position = buffer_position[cut:]
+
+#
+
+def get_data_zero_fill(wig_list, sparse=False):
     """ Returns a tuple of (data, position) containing a matrix of raw read counts,
         and list of coordinates. Positions that are missing are filled in as zero.
 
+    The (K, T) matrix, where T is the last coordinate observed in any of the
+    datasets, is allocated once and the observed sites are written into it
+    with a single indexed assignment per dataset.
+
     Arguments:
         wig_list (list): List of paths to wig files.
+        sparse (bool): Boolean specifying whether to return the read-counts as a
+            scipy.sparse.csr_matrix, holding only the non-zero sites.
 
     Returns:
         tuple: Two lists containing data and positions of the wig files given.
     """
 
     K = len(wig_list)
-    T = 0
 
     if not wig_list:
         return (numpy.zeros((1,0)), numpy.zeros(0), [])
 
-    #NOTE:  This might be slow as we need to find the last insertion site
-    #       over all the replicates. This might be an area to attempt to optimize.
-    last_line = ''
-    for wig_name in wig_list:
-        for line in open(wig_name):
-            if line[0] not in "0123456789": continue
-            last_line = line
-        pos = int(last_line.split()[0])
-        T = max(T,pos)
+    wigs = [read_wig(path, prune=False) for path in wig_list]
+    prune_wig_cache(wig_list)
+    T = max([int(numpy.max(pos)) for (pos, reads) in wigs if len(pos) > 0] + [0])
     
     if T == 0:
         return (numpy.zeros((1,0)), numpy.zeros(0), [])
-    
-    data = numpy.zeros((K,T))
-    position = numpy.zeros(T)
-    for j,path in enumerate(wig_list):
-        reads = []
-        i = 0
-        for line in open(path):
-            if line[0] not in "0123456789": continue
-            tmp = line.split()
-            pos = int(tmp[0])
-            rd = float(tmp[1])
-            
-            # Fill in remaining zeros
-            for fill_pos in range(i, pos - 1):
-                data[j,fill_pos] = 0
-                position[fill_pos] = i
-                i += 1
-                
-            prev_pos = pos
-            data[j,i] = rd
-            position[i] = pos
-            i+=1
+
+    position = numpy.arange(1, T+1)
+    if sparse:
+        rows = numpy.concatenate([numpy.zeros(len(pos), dtype=int) + j for j,(pos, reads) in enumerate(wigs)])
+        cols = numpy.concatenate([pos - 1 for (pos, reads) in wigs])
+        values = numpy.concatenate([reads for (pos, reads) in wigs])
+        ii_nz = values != 0
+        data = scipy.sparse.csr_matrix((values[ii_nz], (rows[ii_nz], cols[ii_nz])), shape=(K,T))
+    else:
+        data = numpy.zeros((K,T))
+        for j,(pos, reads) in enumerate(wigs):
+            data[j, pos - 1] = reads
     return (data, position)
 
 #
@@ -836,9 +1898,28 @@ def combine_replicates(data, method="Sum"):
         method (str): How to combine the replicate dataset.
 
     Returns:
-        list: List of numeric dataset now merged together.
+        list: List of numeric dataset now merged together. Sparse (scipy.sparse)
+            data is merged into a (1,N) sparse matrix. Compact data is merged
+            with "TTRMean" without copying it to float64.
     """
 
+    if scipy.sparse.issparse(data):
+        K = data.shape[0]
+        if method == "Sum":
+            combined = scipy.sparse.csr_matrix(numpy.ones((1,K))).dot(data).rint()
+        elif method == "Mean":
+            combined = (scipy.sparse.csr_matrix(numpy.ones((1,K))).dot(data) / float(K)).rint()
+        elif method == "TTRMean":
+            (data, factors) = norm_tools.normalize_data(data, "TTR")
+            target_factors = norm_tools.norm_to_target(data, 100)
+            data = norm_tools.scale_rows(data, target_factors)
+            combined = (scipy.sparse.csr_matrix(numpy.ones((1,K))).dot(data) / float(K)).rint()
+        else:
+            combined = data[0,:]
+        combined = combined.tocsr()
+        combined.eliminate_zeros()
+        return combined
+
     if method == "Sum":
         combined = numpy.round(numpy.sum(data,0))
     elif method == "Mean":
@@ -848,7 +1929,8 @@ def combine_replicates(data, method="Sum"):
         #data = factors * data
         (data, factors) = norm_tools.normalize_data(data, "TTR")
         target_factors = norm_tools.norm_to_target(data, 100)
-        data = target_factors * data
+        # Scale in place, so compact (float32) data is not copied to float64.
+        data *= target_factors
         combined = numpy.round(numpy.mean(data,0))
     else:
         combined = data[0,:]
@@ -1024,17 +2106,7 @@ def get_pos_hash_pt(path):
     Returns:
         dict: Dictionary of position to list of genes that share that position.
     """
-    hash = {}
-    for line in open(path):
-        if line.startswith("#"): continue
-        tmp = line.strip().split("\t")
-        orf = tmp[8]
-        start = int(tmp[1])
-        end = int(tmp[2])
-        for pos in range(start, end+1):
-            if pos not in hash: hash[pos] = []
-            hash[pos].append(orf)
-    return hash
+    return get_annotation(path, isProt=True).pos_hash()
 
 #
 
@@ -1047,21 +2119,7 @@ def get_pos_hash_gff(path):
     Returns:
         dict: Dictionary of position to list of genes that share that position.
     """
-    hash = {}
-    for line in open(path):
-        if line.startswith("#"): continue
-        tmp = line.strip().split("\t")
-        features = dict([tuple(f.split("=",1)) for f in filter(lambda x: "=" in x, tmp[8].split(";"))])
-        if "ID" not in features: continue
-        orf = features["ID"]
-        chr = tmp[0]
-        type = tmp[2]
-        start = int(tmp[3])
-        end = int(tmp[4])
-        for pos in range(start, end+1):
-            if pos not in hash: hash[pos] = []
-            hash[pos].append(orf)
-    return hash
+    return get_annotation(path, isProt=False).pos_hash()
 
 #
 
@@ -1082,6 +2140,107 @@ def get_pos_hash(path):
 
 #
 
+def get_annotation(path, isProt=None):
+    """Returns the Annotation object of the given file, parsing it only once per process.
+
+    The parsed annotations are memoized by path, size and modification time, so
+    the same file is not read again by each of the helpers or methods that use it.
+
+    Arguments:
+        path (str): Path to annotation in .prot_table or GFF3 format.
+        isProt (bool): Boolean specifying whether the file is in .prot_table
+            format. By default, determined from the extension of the file.
+
+    Returns:
+        Annotation: Object with the genes of the annotation.
+
+    .. seealso:: :class:`Annotation`
+    """
+    if isProt is None:
+        filename, file_extension = os.path.splitext(path)
+        isProt = file_extension.lower() not in [".gff", ".gff3"]
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime, isProt)
+    if key not in _annotation_cache:
+        _annotation_cache[key] = Annotation(path, isProt)
+    return _annotation_cache[key]
+
+#
+
+def get_gene_site_ranges(annotation, position, ignoreCodon=True, nterm=0.0, cterm=0.0):
+    """Returns the range of sites that belongs to each gene of the annotation.
+
+    Sites are assigned to the genes that contain them with the interval index,
+    and the start/stop codon and N/C-terminus filters are applied to all the
+    (site, gene) pairs at once.
+
+    Arguments:
+        annotation (Annotation): Annotation object (see :func:`get_annotation`).
+        position (list): List (or numpy array) of sorted coordinates of the sites.
+        ignoreCodon (bool): Boolean defining whether to ignore the start/stop codon.
+        nterm (float): Float number of the percentage of the N-terminus to ignore.
+        cterm (float): Float number of the percentage of the C-terminus to ignore.
+
+    Returns:
+        tuple: Two numpy arrays (first, last) with, for each gene in annotation
+            order, the index of the first site and one past the last site
+            accepted for the gene. Genes without sites have first == last == 0.
+            Genes that appear more than once in the annotation share the sites
+            (and the coordinates of) their last entry, as in get_gene_info.
+    """
+    G = len(annotation)
+    position = numpy.asarray(position, dtype=int)
+    last_entry = dict((orf, g) for (g, orf) in enumerate(annotation.orf))
+    info = numpy.array([last_entry[orf] for orf in annotation.orf], dtype=int)
+    plus = numpy.array([strand == "+" for strand in annotation.strand], dtype=bool)
+
+    (ii_site, ii_gene) = annotation.index().lookup(position)
+    ii_gene = info[ii_gene]
+    pos = position[ii_site]
+    start = annotation.start[ii_gene]
+    end = annotation.end[ii_gene]
+
+    keep = numpy.ones(len(ii_site), dtype=bool)
+    if ignoreCodon:
+        keep &= numpy.where(plus[ii_gene], pos <= end - 3, pos >= start + 3)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        fraction = (pos - start)/(end - start).astype(float)
+    keep &= ~(fraction < (nterm/100.0))
+    keep &= ~(fraction > ((100-cterm)/100.0))
+    ii_site = ii_site[keep]
+    ii_gene = ii_gene[keep]
+
+    # Reduce the runs of pairs of the same gene (a gene's sites are only
+    # interleaved with those of the genes overlapping it) to the first and
+    # last site of each gene.
+    first = numpy.zeros(G, dtype=int) + len(position)
+    last = numpy.zeros(G, dtype=int)
+    if len(ii_site):
+        ii_run = numpy.flatnonzero(numpy.diff(ii_gene)) + 1
+        run_first = numpy.concatenate(([0], ii_run))
+        run_last = numpy.concatenate((ii_run, [len(ii_gene)])) - 1
+        numpy.minimum.at(first, ii_gene[run_first], ii_site[run_first])
+        numpy.maximum.at(last, ii_gene[run_last], ii_site[run_last] + 1)
+    first[last == 0] = 0
+    return (first[info], last[info])
+
+#
+
+def get_annotation_index(path):
+    """Returns an interval index that maps coordinates to the genes that occur at that coordinate.
+
+    Arguments:
+        path (str): Path to annotation in .prot_table or GFF3 format.
+
+    Returns:
+        AnnotationIndex: Index of the genes in the annotation.
+
+    .. seealso:: :class:`AnnotationIndex` :class:`get_pos_hash`
+    """
+    return get_annotation(path).index()
+
+#
+
 def get_gene_info_pt(path):
     """Returns a dictionary that maps gene id to gene information.
     
@@ -1097,18 +2256,7 @@ def get_gene_info_pt(path):
             - strand
             
     """
-    orf2info = {}
-    for line in open(path):
-        if line.startswith("#"): continue
-        tmp = line.strip().split("\t")
-        orf = tmp[8]
-        name = tmp[7]
-        desc = tmp[0]
-        start = int(tmp[1])
-        end = int(tmp[2])
-        strand = tmp[3]
-        orf2info[orf] = (name, desc, start, end, strand)
-    return orf2info
+    return get_annotation(path, isProt=True).gene_info()
 
 #
 
@@ -1127,30 +2275,7 @@ def get_gene_info_gff(path):
             - strand
             
     """
-    orf2info = {}
-    for line in open(path):
-        if line.startswith("#"): continue
-        tmp = line.strip().split("\t")
-        chr = tmp[0]
-        type = tmp[2]
-        start = int(tmp[3])
-        end = int(tmp[4])
-        length = ((end-start+1)/3)-1
-        strand = tmp[6]
-        features = dict([tuple(f.split("=",1)) for f in filter(lambda x: "=" in x, tmp[8].split(";"))])
-        if "ID" not in features: continue
-        orf = features["ID"]
-        name = features.get("Name", "-")
-        if name == "-": name = features.get("name", "-")
-
-        desc = features.get("Description", "-")
-        if desc == "-": desc = features.get("description", "-")
-        if desc == "-": desc = features.get("Desc", "-")
-        if desc == "-": desc = features.get("desc", "-")
-        if desc == "-": desc = features.get("product", "-")
-
-        orf2info[orf] = (name, desc, start, end, strand)
-    return orf2info
+    return get_annotation(path, isProt=False).gene_info()
 
 #
 
@@ -1242,17 +2367,7 @@ def maxrun(lst,item=0):
     Returns:
         int: Length of the maximum run of consecutive instances of item.
     """
-    best = 0
-    i,n = 0,len(lst)
-    while i<n:
-        if lst[i]==item:
-            j = i+1
-            while j<n and lst[j]==item: j += 1
-            r = j-i
-            if r>best: best = r
-            i = j
-        else: i += 1
-    return best
+    return rle_tools.maxrun(lst, item)
 
 #
 
@@ -1394,29 +2509,14 @@ def runs_w_info(data):
     """Return list of all the runs of consecutive non-insertions with the start and end locations.
 
     Arguments:
-        data (list): List of numeric data to check for runs.
+        data (list): List of numeric data to check for runs. May be a (1,N) scipy.sparse matrix.
     
     Returns:
         list: List of dictionary from run to length and position information of the tun.
+
+    .. seealso:: :class:`pytransit.rle_tools.zero_runs`
     """
-    runs = []
-    start = 1
-    current_r = 0
-    for read in data:
-        if read > 0: # If ending a run of zeros
-            if current_r > 0: # If we were in a run, add to list
-                end = start + current_r - 1
-                runs.append(dict(length = current_r, start = start, end = end))
-            start = start + (current_r + 1)
-            current_r = 0
-        else:
-            current_r += 1
-    
-    # If we ended in a run, add it
-    if current_r > 0:
-        end = start + current_r - 1
-        runs.append(dict(length = current_r, start = start, end = end))
-    return runs
+    return rle_tools.runs_w_info(data)
 
 #
 
@@ -1424,7 +2524,7 @@ def get_genes_in_range(pos_hash, start, end):
     """Returns list of genes that occur in a given range of coordinates.
 
     Arguments:
-        pos_hash (dict): Dictionary of position to list of genes.
+        pos_hash (dict): Dictionary of position to list of genes, or an AnnotationIndex.
         start (int): Start coordinate of the desired range.
         end (int): End coordinate of the desired range.
 
@@ -1432,7 +2532,9 @@ def get_genes_in_range(pos_hash, start, end):
         list: List of genes that fall within range.
 
     """
-    
+    if isinstance(pos_hash, AnnotationIndex):
+        return pos_hash.overlap(start, end)
+
     genes = set()
     for pos in range(start, end + 1):
         if pos in pos_hash:
@@ -1669,7 +1669,7 @@ along with TRANSIT.  If not, see <http://www.gnu.org/licenses/>.
             normchoice = "nonorm"
 
         (fulldata, position) = tnseq_tools.get_data(dataset_list)
-        (fulldata, factors) = norm_tools.normalize_data(fulldata, normchoice, dataset_list, annotationPath)
+        (fulldata, factors) = norm_tools.normalize_data(fulldata, normchoice, dataset_list, annotationPath, position)
         position = position.astype(int)
 
         output = open(path, "w")
@@ -1795,8 +1795,11 @@ along with TRANSIT.  If not, see <http://www.gnu.org/licenses/>.
                 transit_tools.transit_message("Converting annotation file from prot_table format to PTT format")
             (data, position) = tnseq_tools.get_data(datasets)
             orf2info = transit_tools.get_gene_info(annotationpath)
-            hash = transit_tools.get_pos_hash(annotationpath)
-            (orf2reads, orf2pos) = tnseq_tools.get_gene_reads(hash, data, position, orf2info)
+            index = tnseq_tools.get_annotation_index(annotationpath)
+            (ii_site, ii_gene) = index.lookup(position)
+            orf2pos = {}
+            for (i, g) in zip(ii_site, ii_gene):
+                orf2pos.setdefault(index.orf[g], []).append(position[i])
 
             output = open(outputPath, "w")
             output.write("geneID\tstart\tend\tstrand\tTA coordinates\n")
@@ -255,11 +255,15 @@ def convertToCombinedWig(dataset_list, annotationPath, outputPath, normchoice="n
     """
 
 
-    (fulldata, position) = tnseq_tools.get_data(dataset_list)
-    (fulldata, factors) = norm_tools.normalize_data(fulldata, normchoice, dataset_list, annotationPath)
-    position = position.astype(int)
+    if normchoice == "nonorm":
+        # Without normalization, stream the datasets to keep memory bounded.
+        blocks = tnseq_tools.iter_data(dataset_list)
+    else:
+        (fulldata, position) = tnseq_tools.get_data(dataset_list)
+        (fulldata, factors) = norm_tools.normalize_data(fulldata, normchoice, dataset_list, annotationPath, position)
+        blocks = [(fulldata, position.astype(int))]
 
-    hash = get_pos_hash(annotationPath)
+    index = tnseq_tools.get_annotation_index(annotationPath)
     rv2info = get_gene_info(annotationPath)
 
     output = open(outputPath, "w")
@@ -271,13 +275,14 @@ def convertToCombinedWig(dataset_list, annotationPath, outputPath, normchoice="n
         else:
             output.write("#Normalization Factors: %s\n" % " ".join([",".join(["%s" % bx for bx in b]) for b in factors]))
 
-    (K,N) = fulldata.shape
     output.write("#Files:\n")
     for f in dataset_list:
         output.write("#%s\n" % f)
 
-    for i,pos in enumerate(position):
-        output.write("%-10d %s  %s\n" % (position[i], "".join(["%7.1f" % c for c in fulldata[:,i]]),",".join(["%s (%s)" % (orf,rv2info.get(orf,["-"])[0]) for orf in hash.get(position[i], [])])   ))
+    for (data, position) in blocks:
+        genes_at_sites = index.genes_at(position)
+        for i,pos in enumerate(position):
+            output.write("%-10d %s  %s\n" % (position[i], "".join(["%7.1f" % c for c in data[:,i]]),",".join(["%s (%s)" % (orf,rv2info.get(orf,["-"])[0]) for orf in genes_at_sites[i]])   ))
     output.close()
 
 
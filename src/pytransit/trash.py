@@ -96,7 +96,7 @@ class TrashFrame(view_trash.MainFrame):
         #self.hash = draw_trash.hash_prot_genes(annotation)
 
         self.orf2data = transit_tools.get_gene_info(annotation)
-        self.hash = transit_tools.get_pos_hash(annotation)
+        self.hash = tnseq_tools.get_annotation_index(annotation)
         
         self.features = []
 
@@ -268,7 +268,7 @@ class TrashFrame(view_trash.MainFrame):
                     self.feature_hashes.append(H)
                     self.feature_data.append(S)
                 else:
-                    self.feature_hashes.append(transit_tools.get_pos_hash(path))
+                    self.feature_hashes.append(tnseq_tools.get_annotation_index(path))
                     self.feature_data.append(transit_tools.get_gene_info(path))
                 self.updateFunc(self.parent)
                 self.Fit()
@@ -11,6 +11,7 @@ from transit_test import *
 
 import pytransit
 import pytransit.norm_tools as norm_tools
+import pytransit.tnseq_tools as tnseq_tools
 
 from pytransit.analysis.gumbel import GumbelMethod
 from pytransit.analysis.binomial import BinomialMethod
@@ -43,6 +44,18 @@ class TestMethods(TransitTestCase):
         self.assertTrue(os.path.exists(output))
 
 
+    def test_Griffin_stream(self):
+        args = [ctrl_data_txt, annotation, output, "-s", "1000", "-b", "100"]
+        GriffinMethod.fromargs(args).Run()
+        expected = [line for line in open(output) if not line.startswith("#")]
+        tnseq_tools.default_stream = True
+        try:
+            GriffinMethod.fromargs(args).Run()
+        finally:
+            tnseq_tools.default_stream = False
+        self.assertEqual([line for line in open(output) if not line.startswith("#")], expected)
+
+
     def test_HMM(self):
         args = [ctrl_data_txt, annotation, output, "-s", "1000", "-b", "100"]
         G = HMMMethod.fromargs(args)
@@ -59,6 +72,19 @@ class TestMethods(TransitTestCase):
         self.assertTrue(os.path.exists(output))
 
 
+    def test_resampling_stream(self):
+        args = [ctrl_data_txt, exp_data_txt, annotation, output, "-s", "1000"]
+        ResamplingMethod.fromargs(args).Run()
+        # The columns before the test statistic do not depend on the permutations
+        expected = [line.split("\t")[:8] for line in open(output) if not line.startswith("#")]
+        tnseq_tools.default_stream = True
+        try:
+            ResamplingMethod.fromargs(args).Run()
+        finally:
+            tnseq_tools.default_stream = False
+        self.assertEqual([line.split("\t")[:8] for line in open(output) if not line.startswith("#")], expected)
+
+
     def test_resampling_adaptive(self):
         args = [ctrl_data_txt, exp_data_txt, annotation, output, "-s", "1000", "-a"]
         G = ResamplingMethod.fromargs(args)
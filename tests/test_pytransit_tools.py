@@ -3,15 +3,19 @@ sys.path.insert(0, '../src/')
 
 import os
 import shutil
+import tempfile
 import unittest
 import os
 import numpy
+import scipy.stats
+import scipy.optimize
 
 from transit_test import *
 
 import pytransit.norm_tools as norm_tools
 import pytransit.tnseq_tools as tnseq_tools
 import pytransit.stat_tools as stat_tools
+import pytransit.rle_tools as rle_tools
 
 
 
@@ -24,7 +28,161 @@ class TestTnSeqTools(TransitTestCase):
         
         self.assertEqual(K, 5)
         self.assertGreater(N, 70000)
-        
+
+    def test_read_data_cache(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        cache_files = os.listdir(tnseq_tools.cache_dir)
+        # The replicates share one copy of the coordinates
+        self.assertEqual(len([f for f in cache_files if f.endswith("_sites.npy")]), 1)
+        self.assertEqual(len(cache_files), len(all_data_list) + 1)
+        parse_wig = tnseq_tools.parse_wig
+        tnseq_tools.parse_wig = None
+        try:
+            cached_data,cached_position = tnseq_tools.get_data(all_data_list)
+        finally:
+            tnseq_tools.parse_wig = parse_wig
+        self.assertEqual(cached_data.dtype, data.dtype)
+        self.assertTrue((data == cached_data).all())
+        self.assertTrue((position == cached_position).all())
+        # Pruning keeps the most recently used files
+        paths = [os.path.join(tnseq_tools.cache_dir, name) for name in cache_files]
+        for path in paths:
+            os.utime(path, (0, 0))
+        tnseq_tools.read_wig(ctrl_rep1)
+        used = [path for path in paths if os.path.getmtime(path) > 0]
+        self.assertEqual(len(used), 2)
+        self.assertEqual(tnseq_tools.prune_cache(sum(os.path.getsize(path) for path in used)), len(paths) - 2)
+        self.assertEqual(sorted(os.path.join(tnseq_tools.cache_dir, name) for name in os.listdir(tnseq_tools.cache_dir)), sorted(used))
+
+    def test_read_data_cache_limit(self):
+        old_cache_max_size = tnseq_tools.cache_max_size
+        tnseq_tools.cache_max_size = 1
+        try:
+            # The files of the current load are kept even beyond the limit
+            data,position = tnseq_tools.get_data(all_data_list)
+            self.assertEqual(len(os.listdir(tnseq_tools.cache_dir)), len(all_data_list) + 1)
+            parse_wig = tnseq_tools.parse_wig
+            tnseq_tools.parse_wig = None
+            try:
+                cached_data,cached_position = tnseq_tools.get_data(all_data_list)
+            finally:
+                tnseq_tools.parse_wig = parse_wig
+            self.assertTrue((data == cached_data).all())
+            tnseq_tools.get_data([ctrl_rep1])
+            self.assertEqual(sorted(os.path.join(tnseq_tools.cache_dir, name) for name in os.listdir(tnseq_tools.cache_dir)), sorted(tnseq_tools.wig_cache_files(ctrl_rep1)))
+        finally:
+            tnseq_tools.cache_max_size = old_cache_max_size
+
+    def test_read_data_mismatched_coordinates(self):
+        (fd, short_wig) = tempfile.mkstemp(suffix=".wig")
+        with os.fdopen(fd, "w") as f:
+            f.write("variableStep chrom=H37Rv\n60 0\n72 3\n")
+        try:
+            self.assertRaises(ValueError, tnseq_tools.get_data, [ctrl_rep1, short_wig])
+        finally:
+            os.remove(short_wig)
+
+    def test_read_data_parallel(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        parallel_data,parallel_position = tnseq_tools.get_data(all_data_list, workers=2)
+        self.assertTrue((data == parallel_data).all())
+        self.assertTrue((position == parallel_position).all())
+
+    def test_read_data_compact(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        compact_data,compact_position = tnseq_tools.get_data(all_data_list, compact=True)
+        self.assertEqual(compact_data.dtype, numpy.uint32)
+        self.assertTrue((data == compact_data).all())
+        for method in ["TTR", "nzmean"]:
+            norm_data,factors = norm_tools.normalize_data(data, method)
+            compact_norm_data,compact_factors = norm_tools.normalize_data(compact_data, method)
+            self.assertEqual(compact_norm_data.dtype, numpy.float32)
+            self.assertTrue(numpy.allclose(factors, compact_factors))
+            self.assertTrue(numpy.allclose(norm_data, compact_norm_data, rtol=1e-6))
+        combined = tnseq_tools.combine_replicates(data, method="TTRMean")
+        compact_combined = tnseq_tools.combine_replicates(compact_data, method="TTRMean")
+        self.assertEqual(compact_combined.dtype, numpy.float32)
+        self.assertLessEqual(numpy.abs(combined - compact_combined).max(), 1)
+        (fd, fractional_wig) = tempfile.mkstemp(suffix=".wig")
+        with os.fdopen(fd, "w") as f:
+            f.write("variableStep chrom=H37Rv\n60 0.5\n72 3\n")
+        try:
+            self.assertRaises(ValueError, tnseq_tools.get_data, [fractional_wig], compact=True)
+        finally:
+            os.remove(fractional_wig)
+
+    def test_read_data_chunks(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        blocks = list(tnseq_tools.iter_data(all_data_list, window=500000))
+        self.assertGreater(len(blocks), 1)
+        for (block_data, block_position) in blocks:
+            self.assertEqual(len(set((block_position - 1) // 500000)), 1)
+        self.assertTrue((numpy.hstack([d for (d,p) in blocks]) == data).all())
+        self.assertTrue((numpy.concatenate([p for (d,p) in blocks]) == position).all())
+
+    def test_iter_genes(self):
+        for kwargs in [dict(), dict(minread=2, reps="Sum"), dict(reps="Mean", ignoreCodon=False, nterm=5.0, cterm=10.0)]:
+            G = tnseq_tools.Genes(all_data_list, annotation, **kwargs)
+            genes = list(tnseq_tools.iter_genes(all_data_list, annotation, chunk_size=7000, **kwargs))
+            self.assertEqual(sorted(gene.orf for gene in genes), sorted(gene.orf for gene in G))
+            for gene in genes:
+                expected = G[gene.orf]
+                self.assertEqual(gene.reads.shape, expected.reads.shape)
+                self.assertTrue((gene.reads == expected.reads).all())
+                self.assertEqual((gene.k, gene.n, gene.r, gene.s, gene.t), (expected.k, expected.n, expected.r, expected.s, expected.t))
+        self.assertRaises(ValueError, list, tnseq_tools.iter_genes(all_data_list, annotation, reps="TTRMean"))
+
+    def test_stream_factors(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        for method in ["TTR", "zinfnb"]:
+            norm_data,factors = norm_tools.normalize_data(data, method, all_data_list, annotation)
+            self.assertTrue(numpy.allclose(norm_tools.stream_factors(all_data_list, method, annotation), factors))
+        self.assertTrue((norm_tools.stream_factors(all_data_list, "nonorm") == 1).all())
+        self.assertEqual(norm_tools.stream_factors(all_data_list, "nzmean"), None)
+        self.assertEqual(norm_tools.stream_factors(all_data_list, "quantile"), None)
+        G = tnseq_tools.Genes(all_data_list, annotation, norm="TTR")
+        factors = norm_tools.stream_factors(all_data_list, "TTR")
+        for gene in tnseq_tools.iter_genes(all_data_list, annotation, factors=factors, minread=0):
+            self.assertTrue(numpy.allclose(gene.reads, G[gene.orf].reads))
+
+    def test_read_data_compressed(self):
+        import gzip, bz2
+        data,position = tnseq_tools.get_data([ctrl_rep1])
+        temp_dir = tempfile.mkdtemp()
+        try:
+            for (ext, open_func) in [(".gz", gzip.open), (".bz2", bz2.BZ2File)]:
+                compressed_path = os.path.join(temp_dir, "rep1.wig" + ext)
+                with open_func(compressed_path, "wb") as f:
+                    f.write(open(ctrl_rep1).read())
+                compressed_data,compressed_position = tnseq_tools.get_data([compressed_path])
+                self.assertTrue((data == compressed_data).all())
+                self.assertTrue((position == compressed_position).all())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_read_data_zero_fill(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        full_data,full_position = tnseq_tools.get_data_zero_fill(all_data_list)
+        sparse_data,sparse_position = tnseq_tools.get_data_zero_fill(all_data_list, sparse=True)
+        self.assertEqual(full_position[0], 1)
+        self.assertEqual(full_data.shape, (5, full_position[-1]))
+        self.assertTrue((full_data[:,position-1] == data).all())
+        self.assertEqual(numpy.sum(full_data), numpy.sum(data))
+        self.assertTrue((sparse_data.toarray() == full_data).all())
+
+    def test_sparse_data(self):
+        full_data,full_position = tnseq_tools.get_data_zero_fill(all_data_list)
+        sparse_data,sparse_position = tnseq_tools.get_data_zero_fill(all_data_list, sparse=True)
+        norm_data,factors = norm_tools.normalize_data(full_data, "TTR")
+        sparse_norm_data,sparse_factors = norm_tools.normalize_data(sparse_data, "TTR")
+        self.assertTrue(numpy.allclose(factors, sparse_factors))
+        self.assertTrue(numpy.allclose(norm_data, sparse_norm_data.toarray()))
+        combined = tnseq_tools.combine_replicates(full_data, method="Sum")[:50000]
+        sparse_combined = tnseq_tools.combine_replicates(sparse_data, method="Sum")[:,:50000]
+        self.assertEqual(tnseq_tools.runs(combined), tnseq_tools.runs(sparse_combined))
+        self.assertEqual(tnseq_tools.runs_w_info(combined), tnseq_tools.runs_w_info(sparse_combined))
+        self.assertTrue((tnseq_tools.tossify(full_data) == tnseq_tools.tossify(sparse_data)).all())
+
     def test_genes_creation_fromwig(self):
         G = tnseq_tools.Genes(all_data_list, annotation)
         N = len(G)
@@ -61,6 +219,187 @@ class TestTnSeqTools(TransitTestCase):
         self.assertEqual(G[0].name, test_name)
 
 
+    def test_annotation(self):
+        A = tnseq_tools.get_annotation(annotation)
+        self.assertTrue(A is tnseq_tools.get_annotation(annotation))
+        self.assertGreater(len(A), 3000)
+        self.assertEqual(A.orf[0], "Rv0001")
+        orf2info = tnseq_tools.get_gene_info(annotation)
+        self.assertEqual(orf2info["Rv0001"], (A.name[0], A.desc[0], A.start[0], A.end[0], A.strand[0]))
+        # A file rewritten with the same modification time is parsed again
+        (fd, short_annotation) = tempfile.mkstemp(suffix=".prot_table")
+        with os.fdopen(fd, "w") as f:
+            f.writelines(open(annotation).readlines()[:10])
+        try:
+            os.utime(short_annotation, (0, 0))
+            self.assertEqual(len(tnseq_tools.get_annotation(short_annotation)), 10)
+            with open(short_annotation, "w") as f:
+                f.writelines(open(annotation).readlines()[:20])
+            os.utime(short_annotation, (0, 0))
+            self.assertEqual(len(tnseq_tools.get_annotation(short_annotation)), 20)
+        finally:
+            os.remove(short_annotation)
+
+    def test_annotation_index(self):
+        hash = tnseq_tools.get_pos_hash(annotation)
+        index = tnseq_tools.get_annotation_index(annotation)
+        position = numpy.arange(1, 100000)
+        genes_at_sites = index.genes_at(position)
+        for i,pos in enumerate(position):
+            self.assertEqual(genes_at_sites[i], hash.get(pos, []))
+        self.assertEqual(index.get(60), hash[60])
+        self.assertEqual(index.overlap(1500, 2100), tnseq_tools.get_genes_in_range(hash, 1500, 2100))
+
+    def test_annotation_index_long_feature(self):
+        (fd, long_annotation) = tempfile.mkstemp(suffix=".prot_table")
+        with os.fdopen(fd, "w") as f:
+            f.write("genome\t1\t4411532\t+\t0\t-\t-\tregion\tregion\n")
+            f.write(open(annotation).read())
+        try:
+            A = tnseq_tools.get_annotation(annotation)
+            index = tnseq_tools.get_annotation_index(long_annotation)
+            data,position = tnseq_tools.get_data([ctrl_rep1])
+            (ii_site, ii_gene) = index.lookup(position)
+            (base_site, base_gene) = tnseq_tools.get_annotation_index(annotation).lookup(position)
+            self.assertEqual(len(ii_site), len(base_site) + len(position))
+            genes_at_sites = index.genes_at(position[:5000])
+            for i,pos in enumerate(position[:5000]):
+                expected = ["region"] + [A.orf[g] for g in range(len(A)) if A.start[g] <= pos <= A.end[g]]
+                self.assertEqual(genes_at_sites[i], expected)
+            self.assertEqual(index.overlap(1500, 2100), ["Rv0001", "Rv0002", "region"])
+            G = tnseq_tools.Genes([ctrl_rep1], long_annotation)
+            self.assertEqual(G["region"].n, len(position))
+        finally:
+            os.remove(long_annotation)
+
+    def test_gene_site_ranges(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        A = tnseq_tools.get_annotation(annotation)
+        (first, last) = tnseq_tools.get_gene_site_ranges(A, position, nterm=5.0, cterm=5.0)
+        for g in range(0, len(A), 50):
+            (start, end, strand) = (A.start[g], A.end[g], A.strand[g])
+            expected = [i for i,pos in enumerate(position) if start <= pos <= end
+                and (pos <= end - 3 if strand == "+" else pos >= start + 3)
+                and 0.05 <= (pos - start)/float(end - start) <= 0.95]
+            self.assertEqual(range(first[g], last[g]), expected)
+
+    def test_gene_table(self):
+        G = tnseq_tools.Genes(all_data_list, annotation, reps="Sum")
+        table = G.table()
+        self.assertEqual(len(table), len(G))
+        for i,gene in enumerate(G.genes):
+            self.assertEqual((table.k[i], table.n[i], table.r[i], table.s[i], table.t[i]), (gene.k, gene.n, gene.r, gene.s, gene.t))
+            self.assertAlmostEqual(table.theta[i], gene.theta())
+
+    def test_gene_views(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        G = tnseq_tools.Genes([], annotation, data=data, position=position)
+        gene = G["Rv0003"]
+        self.assertTrue(numpy.may_share_memory(gene.reads, G.data))
+        self.assertFalse(hasattr(gene, "__dict__"))
+        self.assertEqual(gene.k, int(numpy.sum(numpy.sum(gene.reads, 0) > 0)))
+
+    def test_rle_tools(self):
+        tosses = numpy.array([0, 0, 1, 0, 1, 1, 0, 0, 0])
+        self.assertEqual(rle_tools.runs(tosses), [2, 0, 1, 0, 0, 3])
+        self.assertEqual(rle_tools.runindex([2, 0, 1, 0, 0, 3]), [0, 2, 3, 4, 5, 6])
+        self.assertEqual(rle_tools.maxrun(list(tosses)), 3)
+        self.assertEqual(rle_tools.maxrun(list(tosses), 1), 2)
+        self.assertEqual(rle_tools.runs_w_info(tosses), [dict(length=2, start=1, end=2), dict(length=1, start=4, end=4), dict(length=3, start=7, end=9)])
+        self.assertEqual(rle_tools.zero_runs(tosses)["length"].tolist(), [2, 1, 3])
+        (max_run, run_end) = rle_tools.segment_max_runs(tosses, [0, 2, 4, 5], [4, 6, 4, 9])
+        self.assertEqual(max_run.tolist(), [2, 1, 0, 3])
+        self.assertEqual(run_end.tolist(), [1, 3, -1, 8])
+
+    def test_genes_select(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        G = tnseq_tools.Genes([], annotation, data=data, position=position)
+        Gctrl = G.select(slice(None, 2))
+        Gexp = tnseq_tools.Genes([], annotation, data=data[2:], position=position)
+        self.assertEqual(len(Gctrl), len(G))
+        self.assertTrue(numpy.may_share_memory(Gctrl.data, G.data))
+        for (gene, expected) in zip(G.select(slice(2, None)).genes, Gexp.genes):
+            self.assertEqual(gene.orf, expected.orf)
+            self.assertTrue((gene.reads == expected.reads).all())
+            self.assertEqual((gene.k, gene.n, gene.r), (expected.k, expected.n, expected.r))
+        self.assertTrue((Gctrl["Rv0003"].reads == data[:2, G.site_start[2]:G.site_end[2]]).all())
+
+    def test_genes_cache(self):
+        old_cache_dir = tnseq_tools.cache_dir
+        tnseq_tools.cache_dir = tempfile.mkdtemp()
+        try:
+            G = tnseq_tools.Genes(all_data_list, annotation, norm="TTR", cache=True)
+            self.assertEqual(len([f for f in os.listdir(tnseq_tools.cache_dir) if f.endswith("_genes.npz")]), 1)
+            cached_G = tnseq_tools.Genes(all_data_list, annotation, norm="TTR", cache=True)
+            self.assertTrue((G.data == cached_G.data).all())
+            self.assertTrue((G.site_start == cached_G.site_start).all())
+            self.assertTrue((G.local_runs() == cached_G.local_runs()).all())
+            self.assertTrue((G.local_thetas() == cached_G.local_thetas()).all())
+            self.assertEqual((cached_G["Rv0003"].k, cached_G["Rv0003"].r), (G["Rv0003"].k, G["Rv0003"].r))
+            # A cached Genes object still writes its factors
+            saved_path = os.path.join(tnseq_tools.cache_dir, "saved_factors.txt")
+            norm_tools.save_factors_file = saved_path
+            tnseq_tools.Genes(all_data_list, annotation, norm="TTR", cache=True)
+            norm_tools.save_factors_file = None
+            (data, position) = tnseq_tools.get_data(all_data_list)
+            (norm_data, factors) = norm_tools.normalize_data(data, "TTR")
+            self.assertTrue(numpy.allclose(norm_tools.lookup_factors(norm_tools.read_factors(saved_path), all_data_list), factors))
+            tnseq_tools.Genes(all_data_list, annotation, norm="TTR", nterm=5.0, cache=True)
+            self.assertEqual(len([f for f in os.listdir(tnseq_tools.cache_dir) if f.endswith("_genes.npz")]), 2)
+            factors_path = os.path.join(tnseq_tools.cache_dir, "factors.txt")
+            norm_tools.write_factors(factors_path, all_data_list, numpy.arange(1.0, 6.0))
+            norm_tools.factors_file = factors_path
+            factors_G = tnseq_tools.Genes(all_data_list, annotation, norm="TTR", cache=True)
+            self.assertEqual(len([f for f in os.listdir(tnseq_tools.cache_dir) if f.endswith("_genes.npz")]), 3)
+            self.assertTrue((factors_G.data == tnseq_tools.Genes(all_data_list, annotation, norm="TTR").data).all())
+            self.assertFalse((factors_G.data == G.data).all())
+        finally:
+            norm_tools.factors_file = None
+            norm_tools.save_factors_file = None
+            shutil.rmtree(tnseq_tools.cache_dir)
+            tnseq_tools.cache_dir = old_cache_dir
+
+    def test_fdr_correction(self):
+        pvalues = [0.04, 0.01, 0.03, 0.04, 0.5, 0.9]
+        qvalues = stat_tools.BH_fdr_correction(pvalues)
+        self.assertTrue(numpy.allclose(qvalues, [0.06, 0.06, 0.06, 0.06, 0.6, 0.9]))
+        self.assertTrue(numpy.allclose(stat_tools.fdr_correction(pvalues, "Bonferroni"), [0.24, 0.06, 0.18, 0.24, 1.0, 1.0]))
+        self.assertTrue(numpy.allclose(stat_tools.fdr_correction(pvalues, "Storey"), qvalues * 2 / 3.0))
+        self.assertTrue(numpy.allclose(stat_tools.BH_fdr_correction(pvalues, "Storey"), qvalues * 2 / 3.0))
+        self.assertTrue(numpy.allclose(stat_tools.BH_fdr_correction(pvalues, "Storey", lam=0.95), qvalues))
+        # All p-values at or below lam
+        pvalues = [0.01, 0.02, 0.3, 0.5]
+        self.assertTrue(numpy.allclose(stat_tools.fdr_correction(pvalues, "Storey"), stat_tools.BH_fdr_correction(pvalues) / 2.0))
+        stat_tools.default_fdr_method = "Bonferroni"
+        try:
+            self.assertTrue(numpy.allclose(stat_tools.BH_fdr_correction(pvalues), [0.04, 0.08, 1.0, 1.0]))
+        finally:
+            stat_tools.default_fdr_method = "BH"
+        self.assertRaises(ValueError, stat_tools.fdr_correction, pvalues, "unknown")
+
+    def test_bayesian_ess_thresholds(self):
+        Z = [0.99, 0.98, 0.97, 0.9, 0.5, 0.3, 0.2, 0.05, 0.02, 0.01, 0.01, 0.0]
+        self.assertEqual(stat_tools.bayesian_ess_thresholds(Z), (0.97, 0.2))
+        self.assertEqual(stat_tools.bayesian_ess_thresholds(Z, 0.5), (0.5, 0.97))
+        self.assertEqual(stat_tools.bayesian_ess_thresholds([1.0]*5 + [0.6, 0.5, 0.4] + [0.0]*5), (0.6, 0.5))
+
+    def test_loess(self):
+        numpy.random.seed(0)
+        X = numpy.random.rand(500)*1e5
+        Y = numpy.random.rand(500)*50
+        expected = numpy.zeros(len(X))
+        for i,x in enumerate(X):
+            W = stat_tools.tricube((X-x)/5000.0)
+            (sW, wsX, wsY, wsXY) = (numpy.sum(W), numpy.sum(W*X), numpy.sum(W*Y), numpy.sum(W*X*Y))
+            B = (sW * wsXY - wsX * wsY)/(sW * numpy.sum(X*X) - wsX**2)
+            expected[i] = B*x + (wsY - B*wsX)/sW
+        self.assertTrue(numpy.allclose(stat_tools.loess(X, Y, h=5000), expected, rtol=1e-10))
+        self.assertTrue((stat_tools.loess(X, Y, h=5000, block=100) == stat_tools.loess(X, Y, h=5000)).all())
+        data,position = tnseq_tools.get_data([ctrl_rep1])
+        corrected = stat_tools.loess_correction(position, data[0])
+        self.assertEqual(len(corrected), len(data[0]))
+        self.assertTrue(((corrected > 0) == (data[0] > 0)).all())
+
     def test_file_types(self):
         types = tnseq_tools.get_file_types(all_data_list)
         types = set(types)
@@ -74,7 +413,108 @@ class TestTnSeqTools(TransitTestCase):
         data,position = tnseq_tools.get_data(all_data_list)
         norm_data,factors = norm_tools.normalize_data(data, "TTR")
         self.assertFalse((factors == numpy.ones(N)).all())
-   
+
+    def test_ecdf_geom_ppf(self):
+        data,position = tnseq_tools.get_data([ctrl_rep1])
+        numpy.random.seed(1)
+        sample = numpy.random.geometric(0.05, size=10000)
+        X = numpy.concatenate((data[0,:2000], [1e9]))
+        expected = [norm_tools.cleaninfgeom(scipy.stats.geom.ppf(norm_tools.ecdf(sample, x), 0.02), 0.02) for x in X]
+        self.assertTrue((norm_tools.ecdf_geom_ppf(sample, X, 0.02) == expected).all())
+
+    def test_quantile_norm(self):
+        data = numpy.array([[5.0, 2, 3, 4], [4, 1, 4, 2], [3, 4, 6, 8]])
+        (norm_data, factors) = norm_tools.QuantileNorm.normalize(data)
+        ranked_means = [2.0, 3.0, 14/3.0, 17/3.0]
+        self.assertTrue(numpy.allclose(norm_data[0], [ranked_means[3], 2.0, 3.0, ranked_means[2]]))
+        self.assertTrue(numpy.allclose(norm_data[1], [ranked_means[2], 2.0, ranked_means[2], 3.0]))
+        self.assertTrue(numpy.allclose(numpy.sort(norm_data[2]), ranked_means))
+        data,position = tnseq_tools.get_data(all_data_list)
+        (norm_data, factors) = norm_tools.QuantileNorm.normalize(data)
+        self.assertTrue(((norm_data > 0) == (data > 0)).all())
+
+    def test_zinfnb(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        (values, counts) = numpy.unique(data[0], return_counts=True)
+        params = [0.5, 0.7, 0.02]
+        (negLL, grad) = norm_tools.Fzinfnb_hist(params, values, counts)
+        self.assertAlmostEqual(negLL, norm_tools.Fzinfnb(params, data[0]), places=4)
+        self.assertTrue(numpy.allclose(grad, scipy.optimize.approx_fprime(params, lambda x: norm_tools.Fzinfnb_hist(x, values, counts)[0], 1e-7), rtol=1e-4))
+        factors = norm_tools.zinfnb_factors(data[:2])
+        self.assertTrue(numpy.allclose(factors.ravel(), [0.0121883, 0.00747111], rtol=1e-5))
+        self.assertTrue((norm_tools.zinfnb_factors(data[:2], workers=2) == factors).all())
+
+    def test_emphist(self):
+        data,position = tnseq_tools.get_data(all_data_list[:2])
+        G = tnseq_tools.Genes(all_data_list[:2], annotation)
+        sums = norm_tools.gene_read_sums(data, position, annotation)
+        expected = [numpy.sum(gene.reads, 1) for gene in G if gene.n > 0]
+        self.assertTrue((sums == numpy.transpose(expected)).all())
+        ii_good = (sums[0] > 0) & (sums[1] > 0)
+        logFC = numpy.log(sums[1,ii_good]/sums[0,ii_good])
+        X = numpy.linspace(numpy.mean(logFC) - 5*numpy.std(logFC), numpy.mean(logFC) + 5*numpy.std(logFC), 50000)
+        self.assertAlmostEqual(norm_tools.kde_peak(logFC), X[scipy.stats.gaussian_kde(logFC)(X).argmax()], delta=2*(X[1]-X[0]))
+        norm_data,factors = norm_tools.normalize_data(data, "emphist", all_data_list[:2], annotation)
+        self.assertTrue((norm_tools.normalize_data(data, "emphist", [], annotation, position)[1] == factors).all())
+        self.assertRaises(ValueError, norm_tools.normalize_data, data, "emphist", [], annotation)
+
+    def test_norm_cache(self):
+        data,position = tnseq_tools.get_data(all_data_list[:2])
+        old_cache_dir = tnseq_tools.cache_dir
+        tnseq_tools.cache_dir = tempfile.mkdtemp()
+        try:
+            numpy.random.seed(1)
+            norm_data,factors = norm_tools.normalize_data(data, "betageom")
+            numpy.random.seed(2)
+            cached_norm_data,cached_factors = norm_tools.normalize_data(data, "betageom")
+            self.assertEqual(len(os.listdir(tnseq_tools.cache_dir)), 1)
+            self.assertTrue((norm_data == cached_norm_data).all())
+            self.assertTrue(numpy.allclose(factors, cached_factors))
+        finally:
+            shutil.rmtree(tnseq_tools.cache_dir)
+            tnseq_tools.cache_dir = old_cache_dir
+
+    def test_norm_factors_file(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        (fd, factors_path) = tempfile.mkstemp(suffix=".txt")
+        os.close(fd)
+        os.remove(factors_path)
+        try:
+            norm_tools.save_factors_file = factors_path
+            norm_data,factors = norm_tools.normalize_data(data, "TTR", all_data_list)
+            norm_tools.save_factors_file = None
+            saved = norm_tools.read_factors(factors_path)
+            self.assertEqual(len(saved), len(all_data_list))
+            self.assertTrue(numpy.allclose(norm_tools.lookup_factors(saved, all_data_list), factors))
+            data = 2*data
+            norm_tools.factors_file = factors_path
+            given_norm_data,given_factors = norm_tools.normalize_data(data, "TTR", all_data_list)
+            self.assertTrue(numpy.allclose(given_norm_data, factors * data))
+            self.assertTrue(norm_tools.lookup_factors(saved, all_data_list[:1] + ["missing.wig"]) is None)
+            self.assertTrue(numpy.allclose(norm_tools.lookup_factors(saved, ["moved/" + os.path.basename(ctrl_rep1)]), factors[0]))
+            shared_name = {"/a/rep1.wig": 1.5, "/b/rep1.wig": 9.0}
+            self.assertTrue(norm_tools.lookup_factors(shared_name, ["/c/rep1.wig"]) is None)
+            self.assertEqual(norm_tools.lookup_factors(shared_name, ["/a/rep1.wig"])[0,0], 1.5)
+            quantile_norm_data,quantile_factors = norm_tools.normalize_data(data, "quantile", all_data_list)
+            self.assertTrue((quantile_norm_data == norm_tools.QuantileNorm.normalize(data)[0]).all())
+        finally:
+            norm_tools.factors_file = None
+            norm_tools.save_factors_file = None
+            if os.path.exists(factors_path):
+                os.remove(factors_path)
+
+    def test_abgc_parallel(self):
+        data,position = tnseq_tools.get_data(all_data_list)
+        data = data[:2,:20000]
+        (norm_data, factors) = norm_tools.AdaptiveBGCNorm.normalize(data, bgsamples=5000, seed=1)
+        (parallel_norm_data, parallel_factors) = norm_tools.AdaptiveBGCNorm.normalize(data, bgsamples=5000, seed=1, workers=2)
+        self.assertTrue((norm_data == parallel_norm_data).all())
+        self.assertEqual(factors, parallel_factors)
+        evaluated = []
+        norm_tools.AdaptiveBGCNorm.normalize(data, bgsamples=5000, seed=1, patience=1, callback=lambda j, frac, gof: evaluated.append((j, frac)))
+        self.assertLess(len(evaluated), 2*16)
+        self.assertEqual(sorted(set(j for (j, frac) in evaluated)), [0, 1])
+
     
     
 
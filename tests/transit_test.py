@@ -1,5 +1,9 @@
 import unittest
 import os
+import shutil
+import tempfile
+
+import pytransit.tnseq_tools as tnseq_tools
 
 ctrl_rep1 = "../src/pytransit/data/glycerol_H37Rv_rep1.wig"
 ctrl_rep2 = "../src/pytransit/data/glycerol_H37Rv_rep2.wig"
@@ -34,6 +38,15 @@ class TransitTestCase(unittest.TestCase):
             print "Removing genes file..."
             os.remove(genes_path)
 
+        # Keep the cached wig files and normalizations out of the user's cache
+        self._cache_dir = tnseq_tools.cache_dir
+        tnseq_tools.cache_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(tnseq_tools.cache_dir, ignore_errors=True)
+        tnseq_tools.cache_dir = self._cache_dir
+
 
 
 